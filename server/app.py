@@ -1,9 +1,10 @@
 import os
 import json
+import time
 import logging
 import firebase_admin
-from firebase_admin import credentials, auth, firestore
-from flask import Flask, request, jsonify
+from firebase_admin import credentials, firestore
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from langchain_groq import ChatGroq
 from langchain.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate, MessagesPlaceholder
@@ -14,6 +15,23 @@ from pinecone import Pinecone, ServerlessSpec
 import re
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
+from streaming import ThinkFilter, TagFilter, sse_event
+from retriever import LocalIndex
+from cache import SemanticCache
+from embeddings import EmbeddingService
+from session_store import SessionTurn, create_session_store
+from history import HistoryManager, estimate_tokens, trim_history
+from expiry import ExpirySweeper, LeaderLease
+from tickets import TicketListCache, build_page, build_ticket_query, parse_ticket_query
+from auth_cache import TokenVerifier
+from ticket_flow import TicketFlow
+from intents import CentroidClassifier, IssueClassifier
+from profiles import ProfileCache
+from jobs import JobQueue
+from metrics import Metrics, set_branch
+from warmup import LazyResource, Warmup
+from llm_gateway import LLMGateway, Overloaded
+from ticket_feed import TicketFeed, TicketFilter
 
 # Load environment variables
 load_dotenv()
@@ -25,25 +43,67 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}}, supports_credentials=True)
 
-# Initialize Firebase
+# Per-stage latency histograms and request counters, exported at /metrics
+metrics = Metrics(trace_spans=os.getenv("TRACE_SPANS", "false").lower() == "true")
+
+@app.before_request
+def start_request_trace():
+    g.trace = metrics.begin_request(request.endpoint or "unknown")
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        if response.is_streamed:
+            # Streamed bodies are produced after this hook; finish once sent
+            response.call_on_close(lambda: metrics.finish(trace, response.status_code))
+        else:
+            metrics.finish(trace, response.status_code)
+    return response
+
+# Initialize Firebase; the Firestore client (gRPC, not fork-safe) is created per process on first use
 try:
     cred = credentials.Certificate("firebase-key.json")
     firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    db = LazyResource("firestore", lambda: firestore.client(), per_process=True)
 except Exception as e:
     logger.error(f"Error initializing Firebase: {str(e)}")
     raise
 
-# Initialize Chat Model
+# Initialize Chat Model; retries are left to the gateway so they share its backoff and limits
 try:
-    llm = ChatGroq(
+    chat_model = ChatGroq(
         model=os.getenv("GROQ_MODEL", "qwen-qwq-32b"),
-        api_key=os.getenv("GROQ_API_KEY")
+        api_key=os.getenv("GROQ_API_KEY"),
+        max_retries=0
     )
 except Exception as e:
     logger.error(f"Error initializing ChatGroq model: {str(e)}")
     raise
 
+# Every Groq call goes through the gateway: bounded concurrency and queue, request-rate
+# limit, coalescing of identical in-flight prompts and retries with jittered backoff
+LLM_RATE = float(os.getenv("LLM_RATE", 0))
+llm = LLMGateway(
+    chat_model,
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", 64)),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", 30)),
+    rate=LLM_RATE or None,
+    burst=int(os.getenv("LLM_BURST", 0)) or None,
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", 3))
+)
+
+def overloaded_response(e):
+    return jsonify({"error": "The assistant is busy, please try again shortly", "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+def event_stream_response(events):
+    return Response(
+        events,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Define AI chat prompts
 system_msg_template = SystemMessagePromptTemplate.from_template(
     template=os.getenv("SYSTEM_PROMPT", '''You are Emma, a friendly and professional customer service representative at our company. Your role is to assist customers with their inquiries in a natural, conversational manner.
@@ -107,28 +167,45 @@ prompt_template = ChatPromptTemplate.from_messages([
     human_msg_template
 ])
 
-# In-memory chat history and last interaction timestamps
-chat_history = {}
-last_interaction = {}
-ticket_details = {}
-
-def save_to_history(username, message, needs_details=False, needs_time=False, needs_ticket=False, ticket_info=None):
-    """Save messages to user chat history and update ticket details."""
-    if username not in chat_history:
-        chat_history[username] = []
-    chat_history[username].append(message)
-    if len(chat_history[username]) > 100:
-        chat_history[username] = chat_history[username][-100:]
-    last_interaction[username] = datetime.now()
-    logger.info(f"Saving to history for {username}, needs_details={needs_details}, needs_time={needs_time}, needs_ticket={needs_ticket}")
+# Per-user sessions: chat history, ticket state and last interaction timestamp
+sessions = create_session_store()
+
+def get_chat_history(user_id):
+    """Return the user's chat history."""
+    return sessions.load(user_id)["history"]
+
+def load_turn(user_id):
+    """Load the user's session once for this request; the caller commits it once."""
+    with metrics.stage("session"):
+        return SessionTurn(sessions, user_id, trim=lambda session: trim_history(session, 100))
+
+def commit_turn(turn):
+    with metrics.stage("session"):
+        turn.commit()
+
+def save_to_history(turn, message, needs_details=False, needs_time=False, needs_ticket=False, ticket_info=None, needs_details_update=False):
+    """Add a message to the turn's chat history and update ticket details (saved on commit)."""
+    turn.append(message)
+    turn.touch(datetime.now().isoformat())
+    logger.debug(f"Saving to history for {turn.user_id}, needs_details={needs_details}, needs_time={needs_time}, needs_ticket={needs_ticket}")
     if needs_details or needs_time or needs_ticket:
-        ticket_details[username] = {
+        turn.set_ticket({
             "needs_details": bool(needs_details),
             "needs_time": bool(needs_time),
             "needs_ticket": bool(needs_ticket),
+            "needs_details_update": bool(needs_details_update),
             "ticket_info": ticket_info
-        }
-    logger.info(f"Updated ticket_details for {username}: {ticket_details.get(username)}")
+        })
+    logger.debug(f"Updated ticket_details for {turn.user_id}: {turn.session['ticket']}")
+
+# Verified-token cache so repeat requests skip signature verification
+token_verifier = TokenVerifier(
+    firebase_admin.get_app().project_id,
+    cache_size=int(os.getenv("TOKEN_CACHE_SIZE", 10000)),
+    max_ttl=int(os.getenv("TOKEN_CACHE_MAX_TTL", 300)),
+    keys_path=os.getenv("FIREBASE_KEYS_CACHE_PATH"),
+    check_revoked=os.getenv("AUTH_CHECK_REVOKED", "false").lower() == "true"
+)
 
 # Firebase Authentication Middleware
 def firebase_auth_required(f):
@@ -140,18 +217,27 @@ def firebase_auth_required(f):
             return jsonify({"error": "Missing or invalid token"}), 401
         try:
             id_token = auth_header.split("Bearer ")[1]
-            decoded_token = auth.verify_id_token(id_token)
+            with metrics.stage("auth"):
+                decoded_token = token_verifier.verify(id_token)
             request.user = decoded_token
         except Exception as e:
             return jsonify({"error": str(e)}), 401
         return f(*args, **kwargs)
     return decorated_function
 
-# Initialize Pinecone
-try:
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    index_name = "test3"
+# Initialize retriever: Pinecone (default) or an in-process index loaded from disk.
+# The model and indexes load lazily (see warmup below), not at import.
+retriever_backend = os.getenv("RETRIEVER_BACKEND", "pinecone").lower()
+index_name = "test3"
+
+def load_index():
+    if retriever_backend == "local":
+        return LocalIndex.load(
+            os.getenv("LOCAL_INDEX_DIR", "kb_index"),
+            metric=os.getenv("LOCAL_INDEX_METRIC", "euclidean"),
+            mmap=os.getenv("LOCAL_INDEX_MMAP", "true").lower() == "true",
+            approximate=os.getenv("LOCAL_INDEX_APPROXIMATE", "false").lower() == "true"
+        )
     if index_name not in pc.list_indexes().names():
         pc.create_index(
             name=index_name, 
@@ -159,27 +245,103 @@ try:
             metric='euclidean',
             spec=ServerlessSpec(cloud='aws', region='us-west-2')
         )
-    index = pc.Index(index_name)
-except Exception as e:
-    logger.error(f"Error initializing Pinecone or SentenceTransformer: {str(e)}")
-    raise
+    return pc.Index(index_name)
+
+embedding_model = LazyResource("embedding_model", lambda: SentenceTransformer('all-MiniLM-L6-v2'))
+pc = LazyResource("pinecone", lambda: Pinecone(api_key=os.getenv("PINECONE_API_KEY")), per_process=True)
+# A local index is read-only memory that forked workers can share; Pinecone's is a network client
+index = LazyResource("index", load_index, per_process=retriever_backend != "local")
+embedding_service = EmbeddingService(
+    embedding_model,
+    batch_window=float(os.getenv("EMBED_BATCH_WINDOW_MS", 5)) / 1000,
+    max_batch_size=int(os.getenv("EMBED_MAX_BATCH_SIZE", 64)),
+    cache_size=int(os.getenv("EMBED_CACHE_SIZE", 4096))
+)
+warmup = Warmup([db, embedding_model, index])
+
+def embed_query(input_text):
+    """Encode a query through the batching, memoizing embedding service."""
+    with metrics.stage("embed"):
+        return embedding_service.encode(input_text)
 
-def find_match(input_text):
-    """Retrieve the most relevant context from Pinecone."""
+def find_match(input_text, input_embedding=None):
+    """Retrieve the most relevant context from the knowledge base index."""
     try:
-        input_embedding = embedding_model.encode(input_text).tolist()
-        logger.info(f"Querying Pinecone with embedding of length: {len(input_embedding)}")
-        result = index.query(vector=input_embedding, top_k=2, include_metadata=True)
-        if len(result["matches"]) >= 2:
-            return result["matches"][0]["metadata"]["text"] + "\n" + result["matches"][1]["metadata"]["text"]
-        elif len(result["matches"]) == 1:
-            return result["matches"][0]["metadata"]["text"]
-        else:
-            return "No relevant context found."
+        if input_embedding is None:
+            input_embedding = embed_query(input_text)
+        logger.debug(f"Querying {retriever_backend} index with embedding of length: {len(input_embedding)}")
+        with metrics.stage("retrieve"):
+            result = index.query(vector=input_embedding, top_k=2, include_metadata=True)
+        return format_matches(result)
     except Exception as e:
         logger.error(f"Error in find_match: {str(e)}")
         raise
 
+def format_matches(result):
+    """Join the text of the top retrieval matches into a context string."""
+    if len(result["matches"]) >= 2:
+        return result["matches"][0]["metadata"]["text"] + "\n" + result["matches"][1]["metadata"]["text"]
+    elif len(result["matches"]) == 1:
+        return result["matches"][0]["metadata"]["text"]
+    else:
+        return "No relevant context found."
+
+# Semantic cache of answers that depend on neither chat history nor ticket state
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", 3600))
+)
+
+def answer_from_cache(turn, query, query_embedding):
+    """Return a cached answer for a near-duplicate query, or None on a miss."""
+    if turn.ticket:
+        return None
+    with metrics.stage("answer_cache"):
+        response = answer_cache.get(query_embedding)
+    if response is not None:
+        set_branch("cache_hit")
+        logger.debug(f"Answer cache hit for {turn.user_id}")
+        save_to_history(turn, {"role": "user", "content": query})
+        save_to_history(turn, {"role": "assistant", "content": response})
+    return response
+
+def is_history_independent(turn):
+    """Whether a reply generated now would not depend on per-user context."""
+    return not turn.history and not turn.ticket
+
+def remember_answer(query_embedding, reply, history_independent):
+    """Cache a reply if it was history-independent and carries no ticket tags."""
+    if history_independent and '<needs_' not in reply:
+        answer_cache.put(query_embedding, reply)
+
+def build_prompt(turn, query, query_embedding=None, context=None):
+    """Build the chat prompt from retrieved context and the user's history."""
+    if context is None:
+        context = find_match(query, query_embedding)
+    input_with_context = f"Context from knowledge base: {context}\n\nUser query: {query}"
+    with metrics.stage("history"):
+        history = history_manager.window(turn.user_id, turn.session, SYSTEM_PROMPT_TOKENS + estimate_tokens(input_with_context))
+    return prompt_template.format(history=history, input=input_with_context)
+
+def strip_think(response):
+    """Remove <think> sections from a complete LLM reply."""
+    think_pattern = r'<think\b[^>]*>.*?</think>'
+    removed_content = re.findall(think_pattern, response, re.DOTALL)
+    if removed_content:
+        logger.debug(f"Removed think sections: {removed_content}")
+    return re.sub(think_pattern, '', response, flags=re.DOTALL).strip()
+
+# Token-budgeted prompt history with a rolling summary of older turns
+SYSTEM_PROMPT_TOKENS = estimate_tokens(system_msg_template.prompt.template)
+history_manager = HistoryManager(
+    sessions,
+    llm,
+    token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", 6000)),
+    summary_batch=int(os.getenv("HISTORY_SUMMARY_BATCH", 6)),
+    clean=strip_think
+)
+
 # Chat endpoint with ticket flagging
 @app.route('/chat', methods=['POST'])
 @firebase_auth_required
@@ -191,239 +353,233 @@ def chat():
         query = data.get("query", "").strip()
         if not query:
             return jsonify({"error": "Query is required"}), 400
-        context = find_match(query)
-        user_id = request.user["uid"]
-        history = chat_history.get(user_id, [])
-        formatted_history = []
-        for msg in history:
-            if msg["role"] == "user":
-                formatted_history.append({"role": "user", "content": msg["content"]})
-            elif msg["role"] == "assistant":
-                formatted_history.append({"role": "assistant", "content": msg["content"]})
-        input_with_context = f"Context from knowledge base: {context}\n\nUser query: {query}"
-        prompt = prompt_template.format(
-            history=formatted_history,
-            input=input_with_context
-        )
-        response = llm.invoke(prompt)
+        turn = load_turn(request.user["uid"])
+        # Deterministic ticket-flow turns skip retrieval and the LLM
+        with metrics.stage("ticket_flow"):
+            response = ticket_flow.handle_turn(turn, query)
+        if response is not None:
+            commit_turn(turn)
+            return jsonify({"response": response})
+        query_embedding = embed_query(query)
+        cached = answer_from_cache(turn, query, query_embedding)
+        if cached is not None:
+            commit_turn(turn)
+            return jsonify({"response": cached})
+        history_independent = is_history_independent(turn)
+        prompt = build_prompt(turn, query, query_embedding)
+        with metrics.stage("llm"):
+            response = llm.invoke(prompt)
         if isinstance(response, AIMessage):
             response = response.content
 
-        # Remove <think> sections
-        think_pattern = r'<think\b[^>]*>.*?</think>'
-        removed_content = re.findall(think_pattern, response, re.DOTALL)
-        if removed_content:
-            logger.info(f"Removed think sections: {removed_content}")
-        response = re.sub(think_pattern, '', response, flags=re.DOTALL).strip()
-
-        # Check for ticket-related tags
-        needs_details = '<needs_details>' in response
-        needs_time = '<needs_time>' in response
-        needs_ticket = '<needs_ticket>' in response
-        ticket_state = ticket_details.get(user_id, {})
-        logger.info(f"Initial ticket state for {user_id}: needs_details={ticket_state.get('needs_details', False)}, needs_time={ticket_state.get('needs_time', False)}, needs_ticket={ticket_state.get('needs_ticket', False)}")
-
-        ticket_info = None
-        if needs_details:
-            logger.info(f"Entering needs_details block for query: {query}")
-            response = response.replace('<needs_details>', '').strip()
-            user_ref = db.collection("chat_saves").document(user_id)
-            user_doc = user_ref.get()
-            if user_doc.exists:
-                user_data = user_doc.to_dict()
-                logger.info(f"Fetched user data for {user_id}: {user_data}")
-                # Determine issue title based on query
-                issue_title = "General Issue"
-                if any(keyword in query.lower() for keyword in ["fix", "repair", "won't turn on", "broken"]):
-                    issue_title = "Repair"
-                elif any(keyword in query.lower() for keyword in ["exchange", "defective", "defect", "faulty"]):
-                    issue_title = "Product Exchange"
-                elif any(keyword in query.lower() for keyword in ["software", "crashed", "technical", "error"]):
-                    issue_title = "Technical Support"
-                elif any(keyword in query.lower() for keyword in ["bill", "charge", "payment", "billing"]):
-                    issue_title = "Billing Inquiry"
-                # Temporary description; will be updated by LLM later
-                ticket_info = {
-                    "first_name": user_data.get("firstName", "Unknown First Name"),
-                    "last_name": user_data.get("lastName", "Unknown Last Name"),
-                    "address": user_data.get("address", "Unknown Address"),
-                    "contact_no": user_data.get("contactNo", "Unknown Contact Number"),
-                    "issue_title": issue_title,
-                    "issue_description": "Temporary description"  # Placeholder
-                }
-            else:
-                logger.warning(f"No user data found for {user_id}, using default values")
-                issue_title = "General Issue"
-                if any(keyword in query.lower() for keyword in ["fix", "repair", "won't turn on", "broken"]):
-                    issue_title = "Repair"
-                elif any(keyword in query.lower() for keyword in ["exchange", "defective", "defect", "faulty"]):
-                    issue_title = "Product Exchange"
-                elif any(keyword in query.lower() for keyword in ["software", "crashed", "technical", "error"]):
-                    issue_title = "Technical Support"
-                elif any(keyword in query.lower() for keyword in ["bill", "charge", "payment", "billing"]):
-                    issue_title = "Billing Inquiry"
-                ticket_info = {
-                    "first_name": "Unknown First Name",
-                    "last_name": "Unknown Last Name",
-                    "address": "Unknown Address",
-                    "contact_no": "Unknown Contact Number",
-                    "issue_title": issue_title,
-                    "issue_description": "Temporary description"
-                }
-            # Replace placeholders in the response with actual user details
-            # Handle variations in placeholder format (e.g., [First Name], [first name], etc.)
-            response = re.sub(r'\[First Name\]', ticket_info["first_name"], response, flags=re.IGNORECASE)
-            response = re.sub(r'\[Last Name\]', ticket_info["last_name"], response, flags=re.IGNORECASE)
-            response = re.sub(r'\[Address\]', ticket_info["address"], response, flags=re.IGNORECASE)
-            response = re.sub(r'\[Contact Number\]', ticket_info["contact_no"], response, flags=re.IGNORECASE)
-            logger.info(f"Response after placeholder replacement: {response}")
-            
-            save_to_history(user_id, {"role": "user", "content": query}, needs_details=True, ticket_info=ticket_info)
-            save_to_history(user_id, {"role": "assistant", "content": response}, needs_details=True, ticket_info=ticket_info)
-            return jsonify({"response": response})
-
-        elif ticket_state.get("needs_details", False) and not needs_time and not needs_ticket:
-            logger.info(f"Processing needs_details confirmation for query: {query}")
-            user_response = query.lower()
-            if "no" in user_response or "correct" in user_response or "looks good" in user_response:
-                response = "Please provide your preferred time for the service (e.g., 2025-04-25 10:00 AM). <needs_time>"
-                save_to_history(user_id, {"role": "user", "content": query}, needs_time=True, ticket_info=ticket_state["ticket_info"])
-                save_to_history(user_id, {"role": "assistant", "content": response}, needs_time=True, ticket_info=ticket_state["ticket_info"])
-            else:
-                response = "Please provide the updated details: First Name: [Your First Name], Last Name: [Your Last Name], Address: [Your Address], Contact Number: [Your Contact Number] <needs_details_update>"
-                save_to_history(user_id, {"role": "user", "content": query}, needs_details=True, ticket_info=ticket_state["ticket_info"])
-                save_to_history(user_id, {"role": "assistant", "content": response}, needs_details=True, ticket_info=ticket_state["ticket_info"])
-            return jsonify({"response": response})
-
-        elif '<needs_details_update>' in response:
-            response = response.replace('<needs_details_update>', '').strip()
-            first_name_match = re.search(r'First Name:\s*([^\,]+)', query, re.IGNORECASE)
-            last_name_match = re.search(r'Last Name:\s*([^\,]+)', query, re.IGNORECASE)
-            address_match = re.search(r'Address:\s*([^\,]+)', query, re.IGNORECASE)
-            contact_no_match = re.search(r'Contact Number:\s*([^\,]+)', query, re.IGNORECASE)
-
-            ticket_info = ticket_state["ticket_info"]
-            ticket_info["first_name"] = first_name_match.group(1).strip() if first_name_match else ticket_info["first_name"]
-            ticket_info["last_name"] = last_name_match.group(1).strip() if last_name_match else ticket_info["last_name"]
-            ticket_info["address"] = address_match.group(1).strip() if address_match else ticket_info["address"]
-            ticket_info["contact_no"] = contact_no_match.group(1).strip() if contact_no_match else ticket_info["contact_no"]
-
-            response = "Please provide your preferred time for the service (e.g., 2025-04-25 10:00 AM). <needs_time>"
-            save_to_history(user_id, {"role": "user", "content": query}, needs_time=True, ticket_info=ticket_info)
-            save_to_history(user_id, {"role": "assistant", "content": response}, needs_time=True, ticket_info=ticket_info)
-            return jsonify({"response": response})
-
-        elif needs_time or ticket_state.get("needs_time", False):
-            logger.info(f"Processing needs_time for query: {query}")
-            if needs_time:
-                response = response.replace('<needs_time>', '').strip()
-            time_match = re.search(r'\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}\s*(?:AM|PM)', query, re.IGNORECASE)
-            if time_match:
-                scheduled_time = time_match.group(0).strip()
-                ticket_info = ticket_state["ticket_info"]
-                ticket_info["scheduled_time"] = scheduled_time
-                
-                # Generate issue description with LLM based on chat history
-                user_query_history = [msg["content"] for msg in chat_history.get(user_id, []) if msg.get("role") == "user"]
-                if user_query_history:
-                    # Get the last 3 user messages for context
-                    recent_queries = user_query_history[-3:]
-                    description_prompt = f"Based on these user messages: {', '.join(recent_queries)}, provide a 1-2 sentence description of their issue."
-                    try:
-                        description_response = llm.invoke(
-                            [{"role": "system", "content": "You are a helpful assistant that writes concise issue descriptions."},
-                             {"role": "user", "content": description_prompt}]
-                        )
-                        if isinstance(description_response, AIMessage):
-                            issue_description = description_response.content
-                        else:
-                            issue_description = description_response
-                        
-                        # Clean up the description - remove any think tags, quotation marks, extra spaces
-                        issue_description = re.sub(r'<think\b[^>]*>.*?</think>', '', issue_description, flags=re.DOTALL)
-                        issue_description = issue_description.replace('"', '').strip()
-                        
-                        # Limit description to 150 characters max
-                        if len(issue_description) > 150:
-                            issue_description = issue_description[:147] + "..."
-                        
-                        ticket_info["issue_description"] = issue_description
-                        logger.info(f"Generated issue description: {issue_description}")
-                    except Exception as e:
-                        logger.error(f"Error generating issue description: {str(e)}")
-                        ticket_info["issue_description"] = "Customer reported an issue with " + ticket_info["issue_title"].lower()
-                else:
-                    ticket_info["issue_description"] = "Customer reported an issue with " + ticket_info["issue_title"].lower()
-
-                # Replace placeholders in the TICKET_DETAILS block
-                response = re.sub(r'\[First Name\]', ticket_info["first_name"], response, flags=re.IGNORECASE)
-                response = re.sub(r'\[Last Name\]', ticket_info["last_name"], response, flags=re.IGNORECASE)
-                response = re.sub(r'\[Address\]', ticket_info["address"], response, flags=re.IGNORECASE)
-                response = re.sub(r'\[Contact Number\]', ticket_info["contact_no"], response, flags=re.IGNORECASE)
-                logger.info(f"Final response before sending to frontend: {response}")
-
-                create_ticket_directly(user_id, ticket_info)
-                response = (
-                    f"Thank you! A ticket is being created. "
-                    f"TICKET_DETAILS: First Name: {ticket_info['first_name']}, "
-                    f"Last Name: {ticket_info['last_name']}, "
-                    f"Address: {ticket_info['address']}, "
-                    f"Contact Number: {ticket_info['contact_no']}, "
-                    f"Issue Title: {ticket_info['issue_title']}, "
-                    f"Issue Description: {ticket_info['issue_description']}, "
-                    f"Scheduled Time: {scheduled_time} <needs_ticket>"
-                )
-                save_to_history(user_id, {"role": "user", "content": query}, needs_ticket=True, ticket_info=ticket_info)
-                save_to_history(user_id, {"role": "assistant", "content": response}, needs_ticket=True, ticket_info=ticket_info)
-            else:
-                response = "Please provide a valid time format (e.g., 2025-04-25 10:00 AM). <needs_time>"
-                save_to_history(user_id, {"role": "user", "content": query}, needs_time=True, ticket_info=ticket_state["ticket_info"])
-                save_to_history(user_id, {"role": "assistant", "content": response}, needs_time=True, ticket_info=ticket_state["ticket_info"])
-            return jsonify({"response": response})
-
-        save_to_history(user_id, {"role": "user", "content": query})
-        save_to_history(user_id, {"role": "assistant", "content": response})
+        response = strip_think(response)
+        remember_answer(query_embedding, response, history_independent)
+        with metrics.stage("ticket_flow"):
+            response = ticket_flow.handle_reply(turn, query, response, query_embedding=query_embedding)
+        commit_turn(turn)
         return jsonify({"response": response})
+    except Overloaded as e:
+        logger.warning(f"Chat request shed: {str(e)}")
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Chat endpoint error: {str(e)}", exc_info=True)
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+# Streaming chat endpoint (Server-Sent Events)
+@app.route('/chat/stream', methods=['POST'])
+@firebase_auth_required
+def chat_stream():
+    """Stream reply tokens as "delta" events, followed by a final "done" event.
+
+    Deltas are provisional: the "done" event carries the response produced by the
+    ticket state machine (placeholder substitution, canned ticket prompts), which
+    clients should treat as authoritative. Mid-flow ticket turns are answered
+    without the LLM and only produce a "done" event; they and cached answers are
+    served even while the LLM gateway is shedding load.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    query = data.get("query", "").strip()
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    # Turns answered without the LLM are resolved before the response starts
+    try:
+        turn = load_turn(request.user["uid"])
+        with metrics.stage("ticket_flow"):
+            response = ticket_flow.handle_turn(turn, query)
+        if response is not None:
+            commit_turn(turn)
+            return event_stream_response([sse_event("done", {"response": response})])
+        query_embedding = embed_query(query)
+        cached = answer_from_cache(turn, query, query_embedding)
+        if cached is not None:
+            commit_turn(turn)
+            return event_stream_response([sse_event("delta", {"text": cached}), sse_event("done", {"response": cached})])
+        # Shed before the 200 goes out so clients still get a 429 with Retry-After
+        llm.admit()
+    except Overloaded as e:
+        logger.warning(f"Chat stream shed: {str(e)}")
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    def generate():
+        try:
+            history_independent = is_history_independent(turn)
+            prompt = build_prompt(turn, query, query_embedding)
+            think_filter = ThinkFilter()
+            tag_filter = TagFilter()
+            reply_parts = []
+            llm_started = time.perf_counter()
+            first_token = True
+            for chunk in llm.stream(prompt):
+                if first_token:
+                    metrics.observe("llm_first_token_seconds", time.perf_counter() - llm_started)
+                    first_token = False
+                text = think_filter.feed(getattr(chunk, "content", chunk))
+                reply_parts.append(text)
+                visible = tag_filter.feed(text)
+                if visible and not tag_filter.seen:
+                    yield sse_event("delta", {"text": visible})
+            tail = think_filter.flush()
+            reply_parts.append(tail)
+            visible = tag_filter.feed(tail) + tag_filter.flush()
+            if visible and not tag_filter.seen:
+                yield sse_event("delta", {"text": visible})
+
+            metrics.observe("llm_stream_seconds", time.perf_counter() - llm_started)
+            reply = "".join(reply_parts).strip()
+            remember_answer(query_embedding, reply, history_independent)
+            with metrics.stage("ticket_flow"):
+                response = ticket_flow.handle_reply(turn, query, reply, query_embedding=query_embedding)
+            commit_turn(turn)
+            yield sse_event("done", {"response": response})
+        except Overloaded as e:
+            logger.warning(f"Chat stream shed: {str(e)}")
+            yield sse_event("error", {"error": "The assistant is busy, please try again shortly", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            yield sse_event("error", {"error": f"Internal server error: {str(e)}"})
+
+    return event_stream_response(stream_with_context(generate()))
+
 # History endpoint
 @app.route('/history', methods=['GET'])
 @firebase_auth_required
 def get_history():
     try:
-        return jsonify({"history": chat_history.get(request.user["uid"], [])})
+        return jsonify({"history": get_chat_history(request.user["uid"])})
     except Exception as e:
         logger.error(f"Get history error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+# Short-lived per-user cache of ticket listings
+ticket_cache = TicketListCache(ttl=int(os.getenv("TICKETS_CACHE_TTL", 30)))
+
+# Per-user chat_saves profile fields, read at most once per ticket conversation
+profile_cache = ProfileCache(
+    db,
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("PROFILE_CACHE_TTL", 300))
+)
+
+# Ticket create/update/expire events pushed to dashboards at /tickets/stream
+ticket_feed = TicketFeed(
+    db,
+    history=int(os.getenv("TICKET_FEED_HISTORY", 1000)),
+    subscriber_queue=int(os.getenv("TICKET_FEED_QUEUE", 256))
+)
+TICKET_FEED_HEARTBEAT = float(os.getenv("TICKET_FEED_HEARTBEAT", 15))
+
 # Endpoint to retrieve tickets
 @app.route('/get_tickets', methods=['GET'])
 @firebase_auth_required
 def get_tickets():
+    """List the user's tickets, newest first, a page at a time.
+
+    Query parameters: limit, cursor (next_cursor from the previous page),
+    status, fields (comma-separated projection) and order (asc or desc).
+    """
     try:
         user_id = request.user["uid"]
-        tickets_ref = db.collection("tickets").where("user_id", "==", user_id)
-        tickets = tickets_ref.stream()
-        ticket_list = [
-            {
-                "id": ticket.id,
-                **ticket.to_dict()
-            } for ticket in tickets
-        ]
-        return jsonify({"tickets": ticket_list})
+        try:
+            params = parse_ticket_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        page = ticket_cache.get(user_id, params)
+        if page is None:
+            with metrics.stage("tickets_query"):
+                page = build_page(build_ticket_query(db.collection("tickets"), user_id, params).stream(), params)
+            ticket_cache.set(user_id, params, page)
+        return jsonify(page)
     except Exception as e:
         logger.error(f"Get tickets error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+def parse_feed_subscription(user_id, profile, args):
+    """Filter for a feed subscriber: admins see every ticket, other users only their own."""
+    requested = args.get("user_id")
+    if profile.get("role") != "admin":
+        if requested not in (None, user_id):
+            raise PermissionError("Only admins can follow other users' tickets")
+        requested = user_id
+    return TicketFilter.from_args(args, user_id=requested)
+
+# Ticket change feed (Server-Sent Events)
+@app.route('/tickets/stream', methods=['GET'])
+@firebase_auth_required
+def ticket_stream():
+    """Push ticket changes as "created", "updated", "expired" and "deleted" events.
+
+    Query parameters: user_id (admins only), types and status (comma-separated).
+    A new connection first gets a "ready" event. A client reconnecting with
+    Last-Event-ID (header or last_event_id parameter) gets the events it missed,
+    or a "reset" event if they are gone, after which it should reload its
+    tickets. Each connection holds a worker thread; the ASGI app serves this
+    route on its event loop.
+    """
+    user_id = request.user["uid"]
+    try:
+        ticket_filter = parse_feed_subscription(user_id, fetch_profile(user_id), request.args)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Ticket stream error: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscription, backlog = ticket_feed.subscribe(ticket_filter, last_event_id)
+
+    def generate():
+        try:
+            if backlog is None:
+                yield sse_event("reset", {"reason": "Missed events are no longer available"}, subscription.start_id)
+            elif not last_event_id:
+                yield sse_event("ready", {}, subscription.start_id)
+            for event in backlog or ():
+                yield sse_event(event["type"], event, event["id"])
+            while True:
+                event = subscription.get(TICKET_FEED_HEARTBEAT)
+                if subscription.lagged:
+                    # Close so the client resumes from its last event id
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(event["type"], event, event["id"])
+        finally:
+            ticket_feed.unsubscribe(subscription)
+
+    return event_stream_response(stream_with_context(generate()))
+
 # Create ticket directly with provided details
-def create_ticket_directly(user_id, ticket_info):
+def create_ticket_directly(user_id, ticket_info, ticket_id=None, created_at=None):
+    """Write the ticket to Firestore; with a ticket_id the write is idempotent."""
     try:
-        user_ref = db.collection("chat_saves").document(user_id)
-        user_doc = user_ref.get()
-        
-        created_at = datetime.now()
+        created_at = datetime.fromisoformat(created_at) if created_at else datetime.now()
         deadline = created_at + timedelta(hours=72)
 
         ticket_data = {
@@ -440,42 +596,121 @@ def create_ticket_directly(user_id, ticket_info):
             "deadline": deadline.isoformat()
         }
         
-        if user_doc.exists:
-            ticket_data["user_role"] = user_doc.to_dict().get("role")
+        if "user_role" in ticket_info:
+            ticket_data["user_role"] = ticket_info["user_role"]
+        else:
+            profile = profile_cache.get(user_id)
+            if profile:
+                ticket_data["user_role"] = profile.get("role")
             
-        new_ticket = db.collection("tickets").add(ticket_data)
-        logger.info(f"Created ticket for user {user_id}: {ticket_data}")
-        
-        chat_history[user_id] = []
-        if user_id in last_interaction:
-            del last_interaction[user_id]
-        if user_id in ticket_details:
-            del ticket_details[user_id]
+        with metrics.stage("ticket_write"):
+            if ticket_id:
+                db.collection("tickets").document(ticket_id).set(ticket_data)
+            else:
+                ticket_id = db.collection("tickets").add(ticket_data)[1].id
+        logger.info(f"Created ticket {ticket_id} for user {user_id}")
+        logger.debug(f"Ticket {ticket_id} data: {ticket_data}")
+        ticket_cache.invalidate_user(user_id)
+        ticket_feed.publish("created", ticket_id, ticket_data)
             
-        return new_ticket[1].id
+        return ticket_id
     except Exception as e:
         logger.error(f"Error creating ticket for user {user_id}: {str(e)}")
         raise
 
-# Background task to delete expired tickets
+# Durable queue that finalizes tickets off the request path
+job_queue = JobQueue(
+    os.getenv("JOBS_DB_PATH", "jobs.db"),
+    workers=int(os.getenv("JOB_WORKERS", 2)),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+)
+
+def submit_ticket(user_id, ticket_info, recent_queries):
+    """Queue ticket finalization and return the new ticket's id immediately."""
+    ticket_id = db.collection("tickets").document().id
+    job_queue.enqueue("finalize_ticket", {
+        "ticket_id": ticket_id,
+        "user_id": user_id,
+        "ticket_info": ticket_info,
+        "recent_queries": recent_queries,
+        "created_at": datetime.now().isoformat()
+    }, idempotency_key=ticket_id)
+    return ticket_id
+
+def finalize_ticket(payload, last_attempt=False):
+    """Job handler: generate the issue description and store the ticket.
+
+    LLM failures (including a shed Overloaded) are retried by the job queue;
+    only the last attempt settles for the generic description.
+    """
+    ticket_info = payload["ticket_info"]
+    with metrics.stage("describe_issue"):
+        ticket_info["issue_description"] = ticket_flow.describe_issue(
+            payload["recent_queries"], ticket_info["issue_title"], fallback_on_error=last_attempt
+        )
+    create_ticket_directly(payload["user_id"], ticket_info, ticket_id=payload["ticket_id"], created_at=payload["created_at"])
+
+job_queue.register("finalize_ticket", finalize_ticket)
+
+def fetch_profile(user_id):
+    """Return the user's chat_saves profile fields, from the cache when possible."""
+    with metrics.stage("profile"):
+        return profile_cache.get(user_id)
+
+# Issue titles come from keywords; optionally, queries without one fall back to the
+# nearest example centroid, reusing the query's retrieval embedding
+issue_classifier = IssueClassifier(
+    centroids=CentroidClassifier(lambda texts: embedding_model.encode(texts))
+    if os.getenv("ISSUE_EMBEDDING_FALLBACK", "false").lower() == "true" else None
+)
+
+# Ticket-creation state machine, consulted before retrieval and the LLM
+ticket_flow = TicketFlow(
+    save_to_history=save_to_history,
+    fetch_profile=fetch_profile,
+    llm=llm,
+    submit_ticket=submit_ticket,
+    classify=issue_classifier.classify
+)
+
+# Background task to delete expired tickets; the lease keeps it to one worker at a time
+ticket_sweeper = ExpirySweeper(
+    db,
+    page_size=int(os.getenv("EXPIRY_PAGE_SIZE", 200)),
+    archive_collection=os.getenv("TICKET_ARCHIVE_COLLECTION"),
+    lease=LeaderLease(db, "ticket_expiry", ttl=int(os.getenv("EXPIRY_LEASE_TTL", 90))),
+    on_expired=lambda ticket_id, ticket: ticket_feed.publish("expired", ticket_id, ticket)
+)
+
 def delete_expired_tickets():
-    try:
-        now = datetime.now()
-        tickets_ref = db.collection("tickets")
-        tickets = tickets_ref.stream()
-        for ticket in tickets:
-            ticket_data = ticket.to_dict()
-            if "deadline" in ticket_data:
-                deadline = datetime.fromisoformat(ticket_data["deadline"])
-                if now > deadline:
-                    tickets_ref.document(ticket.id).delete()
-                    logger.info(f"Deleted expired ticket {ticket.id} for user {ticket_data['user_id']}")
-    except Exception as e:
-        logger.error(f"Error deleting expired tickets: {str(e)}")
+    ticket_sweeper.run()
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(delete_expired_tickets, 'interval', seconds=60)
-scheduler.start()
+scheduler.add_job(job_queue.purge, 'interval', hours=1)
+_background_pid = None
+
+def start_background_tasks():
+    """Start warmup, the scheduler and the job workers in this process (idempotent).
+
+    Threads do not survive fork, so this runs per worker: from create_app(), from
+    the ASGI app's startup, or on a worker's first request.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    warmup.start()
+    if not scheduler.running:
+        scheduler.start()
+    job_queue.start()
+    if os.getenv("TICKET_FEED_WATCH", "false").lower() == "true":
+        # Several workers: every process follows Firestore instead of its own writes
+        ticket_feed.watch()
+
+@app.before_request
+def ensure_background_tasks():
+    start_background_tasks()
 
 @app.route('/api/update-ticket-status', methods=['POST'])
 @firebase_auth_required
@@ -490,13 +725,70 @@ def update_ticket_status():
             "status": data['status'],
             "last_updated": datetime.now().isoformat()
         })
+        ticket_cache.invalidate_ticket(data['ticket_id'])
+        if ticket_feed.local:
+            publish_ticket_update(ticket_ref)
 
         return jsonify({"message": "Ticket status updated successfully"})
     except Exception as e:
         logger.error(f"Error updating ticket status: {str(e)}")
         return jsonify({"error": "Failed to update ticket status"}), 500
 
+def publish_ticket_update(ticket_ref):
+    """Publish the updated ticket to the feed; a failed read only loses the event."""
+    try:
+        snapshot = ticket_ref.get()
+        ticket_feed.publish("updated", snapshot.id, snapshot.to_dict())
+    except Exception as e:
+        logger.error(f"Error publishing ticket update: {str(e)}")
+
+# Internal stats exported alongside the request metrics
+metrics.register_collector("embedding", embedding_service.stats)
+metrics.register_collector("answer_cache", answer_cache.stats)
+metrics.register_collector("token_cache", token_verifier.stats)
+metrics.register_collector("sessions", sessions.stats)
+metrics.register_collector("profile_cache", profile_cache.stats)
+metrics.register_collector("expiry", lambda: ticket_sweeper.stats)
+metrics.register_collector("jobs", lambda: {**job_queue.stats, "depth": job_queue.depth()})
+
+metrics.register_collector("warmup", warmup.stats)
+metrics.register_collector("llm", llm.stats)
+metrics.register_collector("ticket_feed", ticket_feed.stats)
+
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({"status": "alive"})
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: 503 until the model, index and Firestore client are loaded."""
+    ready = warmup.ready()
+    return jsonify({"status": "ready" if ready else "warming", "resources": warmup.status()}), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def create_app(preload=False):
+    """App factory, e.g. ``gunicorn 'app:create_app()'``.
+
+    Nothing heavy happens at import: the embedding model, the index and the
+    Firestore client load in parallel background threads and /readyz answers 503
+    until they are warm. With ``preload=True`` (``gunicorn --preload
+    'app:create_app(preload=True)'``) the model and a local index are loaded
+    once in the master before it forks, so workers start warm and share them
+    copy-on-write; each worker still starts its own threads and network clients.
+    """
+    if preload:
+        warmup.preload()
+    else:
+        start_background_tasks()
+    return app
+
 if __name__ == "__main__":
+    create_app()
     try:
         app.run(
             debug=True,
@@ -504,4 +796,6 @@ if __name__ == "__main__":
             port=int(os.getenv("PORT", 5000))
         )
     finally:
-        scheduler.shutdown()
\ No newline at end of file
+        scheduler.shutdown()
+        job_queue.stop()
+        ticket_feed.close()
\ No newline at end of file
@@ -0,0 +1,288 @@
+"""Asyncio (ASGI) serving mode for the chat API.
+
+Serves the same routes as the Flask app with async handlers, so a request
+waiting on Groq, Pinecone or Firestore holds no thread. Run it with:
+
+    hypercorn asgi:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import logging
+from datetime import datetime
+from functools import wraps
+from firebase_admin import firestore_async
+from langchain.schema import AIMessage
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+import app as core
+from tickets import build_page, build_ticket_query, parse_ticket_query
+from profiles import PROFILE_FIELDS, profile_from_snapshot
+from llm_gateway import Overloaded
+from streaming import sse_event
+
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+app = cors(app, allow_origin="http://localhost:5173", allow_credentials=True)
+
+async_db = None
+async_index = None
+metrics = core.metrics
+
+
+@app.before_request
+async def start_request_trace():
+    g.trace = metrics.begin_request(request.endpoint or "unknown")
+
+
+@app.after_request
+async def finish_request_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        metrics.finish(trace, response.status_code)
+    return response
+
+
+@app.before_serving
+async def open_async_clients():
+    global async_db, async_index
+    core.start_background_tasks()
+    async_db = firestore_async.client()
+    if core.retriever_backend != "local" and hasattr(core.pc, "IndexAsyncio"):
+        async_index = core.pc.IndexAsyncio(host=core.pc.describe_index(core.index_name).host)
+
+
+@app.after_serving
+async def close_async_clients():
+    if async_index is not None:
+        await async_index.close()
+
+
+def firebase_auth_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return jsonify({"error": "Missing or invalid token"}), 401
+        try:
+            id_token = auth_header.split("Bearer ")[1]
+            with metrics.stage("auth"):
+                decoded_token = core.token_verifier.lookup(id_token)
+                if decoded_token is None:
+                    decoded_token = await asyncio.to_thread(core.token_verifier.verify_and_cache, id_token)
+            request.user = decoded_token
+        except Exception as e:
+            return jsonify({"error": str(e)}), 401
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+async def embed_query(query):
+    with metrics.stage("embed"):
+        return await asyncio.wrap_future(core.embedding_service.submit(query))
+
+
+async def fetch_profile(user_id):
+    snapshot = await async_db.collection("chat_saves").document(user_id).get(field_paths=PROFILE_FIELDS)
+    profile = profile_from_snapshot(snapshot)
+    core.profile_cache.set(user_id, profile)
+    return profile
+
+
+async def retrieve_context(query, query_embedding):
+    """Query the knowledge base without blocking the event loop."""
+    if async_index is None:
+        # Local index search is CPU-bound; keep it off the event loop
+        return await asyncio.to_thread(core.find_match, query, query_embedding)
+    with metrics.stage("retrieve"):
+        result = await async_index.query(vector=query_embedding, top_k=2, include_metadata=True)
+    return core.format_matches(result)
+
+
+@app.route('/chat', methods=['POST'])
+@firebase_auth_required
+async def chat():
+    profile_task = None
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        query = data.get("query", "").strip()
+        if not query:
+            return jsonify({"error": "Query is required"}), 400
+        user_id = request.user["uid"]
+        # Session store I/O (SQLite or Redis) blocks, so it runs off the event loop
+        turn = await asyncio.to_thread(core.load_turn, user_id)
+        # Deterministic ticket-flow turns skip retrieval and the LLM; capturing
+        # the time enqueues the ticket job, a SQLite write, so this runs off the loop too
+        with metrics.stage("ticket_flow"):
+            response = await asyncio.to_thread(core.ticket_flow.handle_turn, turn, query)
+        if response is not None:
+            await asyncio.to_thread(core.commit_turn, turn)
+            return jsonify({"response": response})
+        query_embedding = await embed_query(query)
+        cached = core.answer_from_cache(turn, query, query_embedding)
+        if cached is not None:
+            await asyncio.to_thread(core.commit_turn, turn)
+            return jsonify({"response": cached})
+        history_independent = core.is_history_independent(turn)
+
+        # The profile is only needed if the reply starts a ticket, but fetching it
+        # alongside retrieval and generation keeps it off the critical path
+        profile = core.profile_cache.lookup(user_id)
+        if profile is None:
+            profile_task = asyncio.create_task(fetch_profile(user_id))
+        context = await retrieve_context(query, query_embedding)
+        prompt = core.build_prompt(turn, query, context=context)
+        with metrics.stage("llm"):
+            response = await core.llm.ainvoke(prompt)
+        if isinstance(response, AIMessage):
+            response = response.content
+        response = core.strip_think(response)
+        core.remember_answer(query_embedding, response, history_independent)
+
+        if profile_task is not None:
+            if '<needs_details>' in response:
+                with metrics.stage("profile"):
+                    profile = await profile_task
+            else:
+                profile_task.cancel()
+        with metrics.stage("ticket_flow"):
+            response = core.ticket_flow.handle_reply(turn, query, response, profile, query_embedding)
+        await asyncio.to_thread(core.commit_turn, turn)
+        return jsonify({"response": response})
+    except Overloaded as e:
+        if profile_task is not None:
+            profile_task.cancel()
+        logger.warning(f"Chat request shed: {str(e)}")
+        return jsonify({"error": "The assistant is busy, please try again shortly", "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        if profile_task is not None:
+            profile_task.cancel()
+        logger.error(f"Chat endpoint error: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@app.route('/history', methods=['GET'])
+@firebase_auth_required
+async def get_history():
+    try:
+        return jsonify({"history": await asyncio.to_thread(core.get_chat_history, request.user["uid"])})
+    except Exception as e:
+        logger.error(f"Get history error: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/get_tickets', methods=['GET'])
+@firebase_auth_required
+async def get_tickets():
+    try:
+        user_id = request.user["uid"]
+        try:
+            params = parse_ticket_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        page = core.ticket_cache.get(user_id, params)
+        if page is None:
+            query = build_ticket_query(async_db.collection("tickets"), user_id, params)
+            with metrics.stage("tickets_query"):
+                page = build_page([ticket async for ticket in query.stream()], params)
+            core.ticket_cache.set(user_id, params, page)
+        return jsonify(page)
+    except Exception as e:
+        logger.error(f"Get tickets error: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/api/update-ticket-status', methods=['POST'])
+@firebase_auth_required
+async def update_ticket_status():
+    try:
+        data = await request.get_json()
+        if not data or 'ticket_id' not in data or 'status' not in data:
+            return jsonify({"error": "Missing required fields"}), 400
+
+        await async_db.collection("tickets").document(data['ticket_id']).update({
+            "status": data['status'],
+            "last_updated": datetime.now().isoformat()
+        })
+        core.ticket_cache.invalidate_ticket(data['ticket_id'])
+        if core.ticket_feed.local:
+            await publish_ticket_update(data['ticket_id'])
+
+        return jsonify({"message": "Ticket status updated successfully"})
+    except Exception as e:
+        logger.error(f"Error updating ticket status: {str(e)}")
+        return jsonify({"error": "Failed to update ticket status"}), 500
+
+
+async def publish_ticket_update(ticket_id):
+    try:
+        snapshot = await async_db.collection("tickets").document(ticket_id).get()
+        core.ticket_feed.publish("updated", snapshot.id, snapshot.to_dict())
+    except Exception as e:
+        logger.error(f"Error publishing ticket update: {str(e)}")
+
+
+@app.route('/tickets/stream', methods=['GET'])
+@firebase_auth_required
+async def ticket_stream():
+    user_id = request.user["uid"]
+    try:
+        profile = core.profile_cache.lookup(user_id)
+        if profile is None:
+            with metrics.stage("profile"):
+                profile = await fetch_profile(user_id)
+        ticket_filter = core.parse_feed_subscription(user_id, profile, request.args)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Ticket stream error: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscription, backlog = core.ticket_feed.subscribe(ticket_filter, last_event_id, loop=asyncio.get_running_loop())
+
+    async def generate():
+        try:
+            if backlog is None:
+                yield sse_event("reset", {"reason": "Missed events are no longer available"}, subscription.start_id)
+            elif not last_event_id:
+                yield sse_event("ready", {}, subscription.start_id)
+            for event in backlog or ():
+                yield sse_event(event["type"], event, event["id"])
+            while True:
+                event = await subscription.aget(core.TICKET_FEED_HEARTBEAT)
+                if subscription.lagged:
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(event["type"], event, event["id"])
+        finally:
+            core.ticket_feed.unsubscribe(subscription)
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # The feed stays open; do not cut it off at Quart's response timeout
+    response.timeout = None
+    return response
+
+
+@app.route('/healthz', methods=['GET'])
+async def liveness():
+    return jsonify({"status": "alive"})
+
+
+@app.route('/readyz', methods=['GET'])
+async def readiness():
+    ready = core.warmup.ready()
+    return jsonify({"status": "ready" if ready else "warming", "resources": core.warmup.status()}), 200 if ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import google.auth.transport
+import google.auth.transport.requests
+import google.oauth2.id_token
+from firebase_admin import auth
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ISSUER_PREFIX = "https://securetoken.google.com/"
+
+
+class _CachedResponse(google.auth.transport.Response):
+    def __init__(self, data):
+        self._data = data
+
+    @property
+    def status(self):
+        return 200
+
+    @property
+    def headers(self):
+        return {}
+
+    @property
+    def data(self):
+        return self._data
+
+
+class SharedKeyRequest(google.auth.transport.Request):
+    """google-auth transport that shares fetched public keys between worker processes.
+
+    Successful GETs are written to a JSON file (atomically) and served from it
+    until the response's Cache-Control max-age runs out, so the Google signing
+    keys are fetched once per node rather than once per worker.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._inner = google.auth.transport.requests.Request()
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if method != "GET":
+            return self._inner(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+        cached = self._memo.get(url) or self._read().get(url)
+        if cached and cached["expires_at"] > time.time():
+            self._memo[url] = cached
+            return _CachedResponse(cached["data"].encode())
+        response = self._inner(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+        max_age = self._max_age(response.headers.get("cache-control", ""))
+        if response.status == 200 and max_age:
+            entry = {"expires_at": time.time() + max_age, "data": response.data.decode()}
+            self._memo[url] = entry
+            self._write(url, entry)
+        return response
+
+    @staticmethod
+    def _max_age(cache_control):
+        for directive in cache_control.split(","):
+            name, _, value = directive.strip().partition("=")
+            if name.lower() == "max-age" and value.isdigit():
+                return int(value)
+        return 0
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, url, entry):
+        with self._lock:
+            entries = self._read()
+            entries[url] = entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not share public keys via {self.path}: {str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+
+class TokenVerifier:
+    """Verifies Firebase ID tokens and caches the decoded claims.
+
+    Claims are cached under a SHA-256 of the token until the token's ``exp``,
+    but never longer than ``max_ttl`` seconds, so a revoked or disabled account
+    is locked out within that bound. With ``check_revoked`` every cache miss also
+    checks revocation with Firebase.
+    """
+
+    def __init__(self, project_id, cache_size=10000, max_ttl=300, keys_path=None, check_revoked=False):
+        self.project_id = project_id
+        self.max_ttl = max_ttl
+        self.check_revoked = check_revoked
+        self.cache = TTLCache(maxsize=cache_size, ttl=max_ttl)
+        self.request = SharedKeyRequest(keys_path or os.path.join(tempfile.gettempdir(), "vserve-firebase-keys.json"))
+        self.verifications = 0
+        self.verify_seconds_total = 0.0
+        self.verify_seconds_max = 0.0
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode()).hexdigest()
+
+    def verify(self, id_token):
+        """Return the decoded claims for a valid token; raises on invalid tokens."""
+        claims = self.lookup(id_token)
+        return claims if claims is not None else self.verify_and_cache(id_token)
+
+    def lookup(self, id_token):
+        """Return cached claims for the token, or None if it has to be verified."""
+        return self.cache.get(self._key(id_token))
+
+    def verify_and_cache(self, id_token):
+        started = time.perf_counter()
+        claims = self._verify(id_token)
+        elapsed = time.perf_counter() - started
+        self.verifications += 1
+        self.verify_seconds_total += elapsed
+        self.verify_seconds_max = max(self.verify_seconds_max, elapsed)
+        ttl = min(self.max_ttl, claims["exp"] - time.time())
+        if ttl > 0:
+            self.cache.set(self._key(id_token), claims, ttl=ttl)
+        return claims
+
+    def _verify(self, id_token):
+        if self.check_revoked or os.getenv("FIREBASE_AUTH_EMULATOR_HOST"):
+            return auth.verify_id_token(id_token, check_revoked=self.check_revoked)
+        claims = google.oauth2.id_token.verify_firebase_token(id_token, self.request, audience=self.project_id)
+        if claims.get("iss") != ISSUER_PREFIX + self.project_id:
+            raise ValueError(f"Firebase ID token has incorrect \"iss\" (issuer) claim: {claims.get('iss')}")
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise ValueError("Firebase ID token has an invalid \"sub\" (subject) claim")
+        claims["uid"] = subject
+        return claims
+
+    def stats(self):
+        return {
+            **self.cache.stats(),
+            "verifications": self.verifications,
+            "avg_verify_ms": 1000 * self.verify_seconds_total / self.verifications if self.verifications else 0.0,
+            "max_verify_ms": 1000 * self.verify_seconds_max
+        }
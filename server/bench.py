@@ -0,0 +1,420 @@
+"""Offline load test for the Flask chat API.
+
+Runs app.py in-process against fakes of ChatGroq, the SentenceTransformer model,
+the Pinecone index and Firestore, each with configurable injected latency, and
+drives concurrent multi-turn conversations through it (knowledge-base questions,
+the full ticket flow, history and ticket listings). Reports p50/p95/p99 latency
+and requests/sec per endpoint and conversation step. No credentials or network
+access are needed:
+
+    python bench.py --users 16 --conversations 200 --llm-latency 400
+
+Save a run with --json and pass it back as --baseline to fail (exit 1) when a
+p99 regresses by more than --tolerance. The run also fails when a ticket the
+server confirmed opening was not written once the job queue drained.
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import tempfile
+import itertools
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
+from langchain.schema import AIMessage
+
+KB_QUESTIONS = [
+    "How do I reset my password?",
+    "What are your opening hours?",
+    "How can I track my order?",
+    "Do you offer international shipping?",
+    "How do I update my billing address?",
+    "What is your return policy?",
+    "How long does delivery take?",
+    "Can I change my order after placing it?"
+]
+ISSUES = [
+    "My laptop won't turn on",
+    "My phone is defective and I want an exchange",
+    "The software crashed and shows an error",
+    "There is a wrong charge on my bill"
+]
+DETAILS_REPLY = (
+    "I understand how frustrating this must be. This needs one of our agents. I have your details as: "
+    "First Name: [First Name], Last Name: [Last Name], Address: [Address], "
+    "Contact Number: [Contact Number]. Would you like to make any changes? <needs_details>"
+)
+
+
+def _pause(latency):
+    if latency > 0:
+        time.sleep(latency * random.uniform(0.8, 1.2))
+
+
+class FakeSentenceTransformer:
+    """Deterministic 384-d embeddings; same normalized text, same vector."""
+
+    def __init__(self, name, latency=0.0):
+        self.latency = latency
+
+    def encode(self, texts, batch_size=32):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        _pause(self.latency)
+        vectors = np.array([
+            np.random.default_rng(abs(hash(" ".join(text.lower().strip("?!. ").split())))).normal(size=384)
+            for text in texts
+        ], dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+class FakeChatGroq:
+    """Scripted replies shaped like the real model's, including <think> sections."""
+
+    def __init__(self, latency=0.0, **kwargs):
+        self.latency = latency
+        self.calls = 0
+
+    def _reply(self, prompt):
+        self.calls += 1
+        text = str(prompt)
+        if "issue descriptions" in text:
+            return "<think>Summarize.</think>Customer's device has a fault that needs an agent."
+        if "summarize customer service conversations" in text:
+            return "The customer asked several support questions and got answers."
+        query = text.split("User query:")[-1].lower()
+        if any(issue.lower() in query for issue in ISSUES):
+            return "<think>This needs a ticket.</think>" + DETAILS_REPLY
+        return "<think>Look at the context.</think>I'd be happy to help! " + " ".join(["Here is what to do."] * 8)
+
+    def invoke(self, prompt):
+        _pause(self.latency)
+        return AIMessage(content=self._reply(prompt))
+
+    def stream(self, prompt):
+        reply = self._reply(prompt)
+        chunks = [reply[i:i + 8] for i in range(0, len(reply), 8)]
+        # Time to first token, then the rest spread over the chunks
+        _pause(self.latency * 0.3)
+        for chunk in chunks:
+            _pause(self.latency * 0.7 / len(chunks))
+            yield AIMessage(content=chunk)
+
+
+class FakeIndex:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def query(self, vector, top_k=2, include_metadata=True):
+        _pause(self.latency)
+        return {"matches": [
+            {"id": f"kb-{i}", "score": 0.2 * (i + 1), "metadata": {"text": f"Knowledge base article {i}."}}
+            for i in range(top_k)
+        ]}
+
+
+class FakePinecone:
+    def __init__(self, latency=0.0, **kwargs):
+        self.latency = latency
+
+    def list_indexes(self):
+        return types.SimpleNamespace(names=lambda: ["test3"])
+
+    def Index(self, name):
+        return FakeIndex(self.latency)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self, field_paths=None, transaction=None):
+        _pause(self.db.latency)
+        with self.db.lock:
+            data = self.db.data[self.collection].get(self.id)
+        if data is not None and field_paths:
+            data = {field: data[field] for field in field_paths if field in data}
+        return FakeSnapshot(self, data)
+
+    def set(self, data):
+        _pause(self.db.latency)
+        with self.db.lock:
+            self.db.data[self.collection][self.id] = dict(data)
+
+    def update(self, data):
+        _pause(self.db.latency)
+        with self.db.lock:
+            self.db.data[self.collection][self.id].update(data)
+
+    def delete(self):
+        _pause(self.db.latency)
+        with self.db.lock:
+            self.db.data[self.collection].pop(self.id, None)
+
+
+class FakeQuery:
+    """Equality filters, order_by (one direction, "__name__" is the id), start_after, select and limit."""
+
+    def __init__(self, db, collection, filters=(), order=(), after=None, fields=None, limit=None):
+        self.db = db
+        self.collection = collection
+        self.filters = filters
+        self.order = order
+        self.after = after
+        self.fields = fields
+        self._limit = limit
+
+    def _with(self, **changes):
+        state = dict(filters=self.filters, order=self.order, after=self.after, fields=self.fields, limit=self._limit)
+        state.update(changes)
+        return FakeQuery(self.db, self.collection, **state)
+
+    def where(self, field, op, value):
+        return self._with(filters=self.filters + ((field, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._with(order=self.order + ((field, direction),))
+
+    def start_after(self, values):
+        return self._with(after=values)
+
+    def select(self, fields):
+        return self._with(fields=fields)
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def stream(self):
+        _pause(self.db.latency)
+        with self.db.lock:
+            rows = [(doc_id, dict(data)) for doc_id, data in self.db.data[self.collection].items()
+                    if all(data.get(field) == value for field, value in self.filters)]
+        if self.order:
+            def sort_key(row):
+                return tuple(row[0] if field == "__name__" else row[1].get(field) or "" for field, _ in self.order)
+
+            descending = self.order[0][1] == "DESCENDING"
+            rows.sort(key=sort_key, reverse=descending)
+            if self.after:
+                bound = tuple(self.after[field] for field, _ in self.order if field in self.after)
+                if descending:
+                    rows = [row for row in rows if sort_key(row)[:len(bound)] < bound]
+                else:
+                    rows = [row for row in rows if sort_key(row)[:len(bound)] > bound]
+        for doc_id, data in rows[:self._limit]:
+            if self.fields:
+                data = {field: data[field] for field in self.fields if field in data}
+            yield FakeSnapshot(FakeDocument(self.db, self.collection, doc_id), data)
+
+
+class FakeCollection(FakeQuery):
+    _ids = itertools.count()
+
+    def __init__(self, db, name):
+        super().__init__(db, name)
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.db, self.collection, doc_id or f"doc{next(self._ids)}")
+
+    def add(self, data):
+        document = self.document()
+        document.set(data)
+        return None, document
+
+
+class FakeFirestore:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.data = defaultdict(dict)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+
+def load_app(args):
+    """Import app.py with every external client replaced by a fake."""
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    os.environ.setdefault("SESSION_BACKEND", "memory")
+    os.environ.setdefault("JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="vserve-bench-"), "jobs.db"))
+    db = FakeFirestore(args.firestore_latency / 1000)
+    llm = FakeChatGroq(args.llm_latency / 1000)
+    sentence_transformers = types.ModuleType("sentence_transformers")
+    sentence_transformers.SentenceTransformer = lambda name: FakeSentenceTransformer(name, args.embed_latency / 1000)
+    patches = [
+        mock.patch.dict(sys.modules, {"sentence_transformers": sentence_transformers}),
+        mock.patch("firebase_admin.credentials.Certificate"),
+        mock.patch("firebase_admin.initialize_app"),
+        mock.patch("firebase_admin.get_app", return_value=types.SimpleNamespace(project_id="bench")),
+        mock.patch("firebase_admin.firestore.client", return_value=db),
+        mock.patch("langchain_groq.ChatGroq", return_value=llm),
+        mock.patch("pinecone.Pinecone", lambda **kwargs: FakePinecone(args.index_latency / 1000)),
+        mock.patch("apscheduler.schedulers.background.BackgroundScheduler"),
+        # Any "Bearer <uid>" token is valid; the token cache still runs for real
+        mock.patch("auth_cache.TokenVerifier._verify", lambda self, token: {"uid": token, "exp": time.time() + 3600})
+    ]
+    for patch in patches:
+        patch.start()
+    import app as core
+    return core, db, llm
+
+
+def conversation(client, user_id, rng, args, record):
+    """One user session: a few KB questions, maybe a ticket, then the listings.
+
+    Returns the number of tickets the server confirmed opening.
+    """
+    headers = {"Authorization": f"Bearer {user_id}"}
+    chat_path = "/chat/stream" if args.stream else "/chat"
+
+    def chat(step, query):
+        started = time.perf_counter()
+        response = client.post(chat_path, json={"query": query}, headers=headers)
+        body = response.get_data(as_text=True)
+        response.close()
+        record(f"POST {chat_path} ({step})", time.perf_counter() - started, response.status_code)
+        return body
+
+    def get(path):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        record(f"GET {path.split('?')[0]}", time.perf_counter() - started, response.status_code)
+
+    opened = 0
+    for _ in range(rng.randint(1, args.questions)):
+        chat("kb", rng.choice(KB_QUESTIONS))
+    if rng.random() < args.ticket_ratio:
+        chat("issue", rng.choice(ISSUES))
+        if rng.random() < 0.25:
+            chat("change_details", "I want to change my details")
+            chat("update_details", "First Name: Sam, Last Name: Lee, Address: 9 High St, Contact Number: 555-0100")
+        else:
+            chat("confirm_details", "Looks good")
+        if "Ticket ID:" in chat("capture_time", "2025-04-25 10:00 AM"):
+            opened = 1
+    get("/history")
+    get("/get_tickets?limit=20")
+    return opened
+
+
+def summarize(samples, wall):
+    results = {}
+    for name, entries in sorted(samples.items()):
+        latencies = np.array([seconds for seconds, _ in entries]) * 1000
+        results[name] = {
+            "count": len(entries),
+            "errors": sum(1 for _, status in entries if status >= 400),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            "rps": round(len(entries) / wall, 2)
+        }
+    return results
+
+
+def print_table(results, wall):
+    print(f"{'endpoint':<42}{'count':>7}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for name, row in results.items():
+        print(f"{name:<42}{row['count']:>7}{row['errors']:>7}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['rps']:>9}")
+    print(f"total {sum(row['count'] for row in results.values())} requests in {wall:.2f}s")
+
+
+def compare(results, baseline, tolerance):
+    """Return the endpoints whose p99 regressed beyond the tolerance."""
+    regressions = []
+    for name, row in results.items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous and row["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['p99_ms']} -> {row['p99_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the chat API")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--conversations", type=int, default=100, help="total conversations to run")
+    parser.add_argument("--questions", type=int, default=3, help="max KB questions per conversation")
+    parser.add_argument("--ticket-ratio", type=float, default=0.3, help="share of conversations that open a ticket")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream instead of /chat")
+    parser.add_argument("--llm-latency", type=float, default=300, help="ms per Groq call")
+    parser.add_argument("--embed-latency", type=float, default=5, help="ms per embedding batch")
+    parser.add_argument("--index-latency", type=float, default=30, help="ms per Pinecone query")
+    parser.add_argument("--firestore-latency", type=float, default=15, help="ms per Firestore call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p99 regression vs the baseline")
+    args = parser.parse_args()
+
+    core, db, llm = load_app(args)
+    for user in range(args.users):
+        db.data["chat_saves"][f"bench-user-{user}"] = {
+            "firstName": "Jane", "lastName": "Roe", "address": "1 Elm St", "contactNo": "555-0199", "role": "user"
+        }
+
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+
+    def record(name, seconds, status):
+        with samples_lock:
+            samples[name].append((seconds, status))
+
+    def run(number):
+        rng = random.Random(args.seed * 1000003 + number)
+        return conversation(core.app.test_client(), f"bench-user-{number % args.users}", rng, args, record)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        opened = sum(pool.map(run, range(args.conversations)))
+    wall = time.perf_counter() - started
+
+    # Let the job queue finish writing the tickets opened during the run
+    deadline = time.time() + 30
+    while core.job_queue.depth() and time.time() < deadline:
+        time.sleep(0.1)
+
+    results = summarize(samples, wall)
+    print_table(results, wall)
+    written = len(db.data["tickets"])
+    print(f"llm calls {llm.calls}, tickets opened {opened}, tickets written {written}, "
+          f"answer cache {core.answer_cache.stats()}, jobs {core.job_queue.stats}, llm gateway {core.llm.stats()}")
+    report = {"config": vars(args), "wall_seconds": round(wall, 3), "endpoints": results,
+              "tickets": {"opened": opened, "written": written}}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    failed = False
+    if written != opened:
+        print(f"MISMATCH {opened} tickets opened but {written} written")
+        failed = True
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    core.job_queue.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
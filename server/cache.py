@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def discard(self, predicate):
+        """Remove every entry whose key matches ``predicate``."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SemanticCache:
+    """LRU/TTL cache looked up by embedding similarity instead of exact key.
+
+    A lookup returns the value stored for the most similar cached embedding if its
+    cosine similarity is at least ``threshold``. Embeddings live in a preallocated
+    matrix so a lookup is a single matrix-vector product over at most ``maxsize``
+    rows.
+    """
+
+    def __init__(self, threshold=0.95, maxsize=1024, ttl=3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._valid = np.zeros(maxsize, dtype=bool)
+        self._expires = np.zeros(maxsize)
+        self._entries = OrderedDict()  # slot -> value, in LRU order
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, embedding):
+        vector = self._normalize(embedding)
+        with self._lock:
+            # Drop expired entries first so they cannot shadow a live match
+            for slot in np.flatnonzero(self._valid & (self._expires <= time.monotonic())):
+                self._evict(int(slot))
+            if not self._entries:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ vector
+            similarities[~self._valid] = -np.inf
+            slot = int(np.argmax(similarities))
+            value = self._entries[slot]
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return value
+
+    def put(self, embedding, value):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            if len(self._entries) >= self.maxsize:
+                self._evict(next(iter(self._entries)))
+            slot = int(np.argmin(self._valid))
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._entries[slot] = value
+
+    def _evict(self, slot):
+        del self._entries[slot]
+        self._valid[slot] = False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._valid[:] = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
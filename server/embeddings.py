@@ -0,0 +1,116 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """Cache key for a query: case and whitespace do not change the (uncased) embedding."""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingService:
+    """Micro-batching, memoizing front end for a SentenceTransformer model.
+
+    Concurrent ``encode()`` calls are queued and a single worker thread encodes
+    whatever arrives within ``batch_window`` seconds (up to ``max_batch_size``
+    texts) in one model call. Results are memoized by normalized text.
+    """
+
+    def __init__(self, model, batch_window=0.005, max_batch_size=64, cache_size=4096, cache_ttl=3600):
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._encoded = 0
+        self._largest_batch = 0
+        self._queued = 0
+        self._queue_wait_total = 0.0
+
+    def encode(self, text):
+        """Return the embedding of ``text`` as a list of floats."""
+        return self.submit(text).result()
+
+    def submit(self, text):
+        """Queue ``text`` for encoding and return a Future for its embedding.
+
+        Async callers can await it with ``asyncio.wrap_future()`` without
+        holding a thread while the batch is encoded.
+        """
+        future = Future()
+        key = normalize_text(text)
+        embedding = self.cache.get(key)
+        if embedding is not None:
+            future.set_result(embedding)
+            return future
+        self._ensure_worker()
+        self._queue.put((key, future, time.perf_counter()))
+        return future
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so start one per process on first use
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            texts = list(dict.fromkeys(key for key, _, _ in batch))
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts))
+                embeddings = dict(zip(texts, (vector.tolist() for vector in vectors)))
+            except Exception as e:
+                logger.error(f"Error encoding batch of {len(texts)}: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for key, embedding in embeddings.items():
+                self.cache.set(key, embedding)
+            for key, future, enqueued_at in batch:
+                self._queued += 1
+                self._queue_wait_total += started - enqueued_at
+                future.set_result(embeddings[key])
+            self._batches += 1
+            self._encoded += len(texts)
+            self._largest_batch = max(self._largest_batch, len(texts))
+
+    def stats(self):
+        return {
+            "batches": self._batches,
+            "encoded": self._encoded,
+            "avg_batch_size": self._encoded / self._batches if self._batches else 0.0,
+            "max_batch_size": self._largest_batch,
+            "avg_queue_wait_ms": 1000 * self._queue_wait_total / self._queued if self._queued else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "cache": self.cache.stats()
+        }
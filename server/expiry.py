@@ -0,0 +1,128 @@
+import os
+import time
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """Firestore-backed lease so that only one process runs a periodic job.
+
+    The holder renews the lease each time it runs; if it stops, another process
+    takes over once ``ttl`` seconds have passed. The expiry is a UTC timestamp,
+    so hosts in different timezones agree on it.
+    """
+
+    def __init__(self, db, name, ttl=90):
+        # The lock document is resolved per call: ``db`` may be a lazy client
+        # that must not be created at import time or shared across a fork
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+
+    @property
+    def owner(self):
+        # Evaluated per call so forked workers get their own identity
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self):
+        """Take or renew the lease; return whether this process holds it."""
+        owner = self.owner
+        ttl = self.ttl
+        ref = self.db.collection("locks").document(self.name)
+
+        @firestore.transactional
+        def try_acquire(transaction):
+            now = datetime.now(timezone.utc)
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists:
+                lease = snapshot.to_dict()
+                expires_at = lease.get("expires_at")
+                # Leases written before expiry became a timestamp count as expired
+                if lease.get("owner") != owner and isinstance(expires_at, datetime) and expires_at > now:
+                    return False
+            transaction.set(ref, {"owner": owner, "expires_at": now + timedelta(seconds=ttl)})
+            return True
+
+        return try_acquire(self.db.transaction())
+
+
+class ExpirySweeper:
+    """Deletes (or archives) tickets whose deadline has passed.
+
+    Expired tickets are found with a range query on ``deadline`` (an ISO string,
+    so lexical order is chronological), read a page at a time with query cursors
+    and removed with batched writes. ``on_expired(ticket_id, ticket)`` is called
+    for each ticket once its batch has committed.
+    """
+
+    def __init__(self, db, page_size=200, archive_collection=None, lease=None, on_expired=None):
+        self.db = db
+        # A batch holds at most 500 writes and archiving costs two per ticket
+        self.page_size = min(page_size, 250 if archive_collection else 500)
+        self.archive_collection = archive_collection
+        self.lease = lease
+        self.on_expired = on_expired
+        self.stats = {
+            "runs": 0,
+            "skipped": 0,
+            "errors": 0,
+            "total_deleted": 0,
+            "last_deleted": 0,
+            "last_duration_ms": 0.0
+        }
+
+    def run(self):
+        """Run one sweep if this process holds the lease; return the number of tickets removed."""
+        try:
+            if self.lease is not None and not self.lease.acquire():
+                self.stats["skipped"] += 1
+                return 0
+            started = time.perf_counter()
+            deleted = self.sweep()
+            self.stats["runs"] += 1
+            self.stats["last_deleted"] = deleted
+            self.stats["total_deleted"] += deleted
+            self.stats["last_duration_ms"] = 1000 * (time.perf_counter() - started)
+            if deleted:
+                logger.info(f"Expired {deleted} tickets in {self.stats['last_duration_ms']:.0f} ms")
+            return deleted
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Error deleting expired tickets: {str(e)}")
+            return 0
+
+    def sweep(self):
+        now = datetime.now().isoformat()
+        query = (
+            self.db.collection("tickets")
+            .where("deadline", "<", now)
+            .order_by("deadline")
+            .limit(self.page_size)
+        )
+        deleted = 0
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            if not page:
+                break
+            batch = self.db.batch()
+            for ticket in page:
+                if self.archive_collection:
+                    batch.set(
+                        self.db.collection(self.archive_collection).document(ticket.id),
+                        {**ticket.to_dict(), "archived_at": now}
+                    )
+                batch.delete(ticket.reference)
+            batch.commit()
+            if self.on_expired is not None:
+                for ticket in page:
+                    self.on_expired(ticket.id, ticket.to_dict())
+            deleted += len(page)
+            if len(page) < self.page_size:
+                break
+            last = page[-1]
+        return deleted
@@ -0,0 +1,113 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain.schema import AIMessage
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def trim_history(session, limit):
+    """Keep the last ``limit`` messages, counting dropped ones in the session offset."""
+    dropped = len(session["history"]) - limit
+    if dropped <= 0:
+        return
+    session["history"] = session["history"][dropped:]
+    session["offset"] = session.get("offset", 0) + dropped
+
+
+class HistoryManager:
+    """Fits chat history into a token budget, folding older turns into a rolling summary.
+
+    ``window()`` returns the newest messages that fit the budget, preceded by the
+    stored summary of everything before them. Turns that fall out of the window
+    are summarized in the background, a few at a time, by extending the previous
+    summary rather than re-reading the whole conversation.
+
+    The summary is stored in the session as ``{"text": ..., "upto": n}``, where
+    ``n`` counts every message the summary covers, including ones since trimmed
+    from the history (see ``trim_history``). It is written with the store's
+    atomic ``update()``, so it never races with chat turns being saved.
+    """
+
+    def __init__(self, sessions, llm, token_budget=6000, summary_batch=6, clean=None):
+        self.sessions = sessions
+        self.llm = llm
+        self.token_budget = token_budget
+        self.summary_batch = summary_batch
+        self.clean = clean or (lambda text: text.strip())
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def window(self, user_id, session, reserved_tokens=0):
+        """Return prompt-ready history from the user's loaded session within the remaining token budget."""
+        history = session["history"]
+        offset = session.get("offset", 0)
+        summary = session.get("summary") or {"text": "", "upto": 0}
+        covered = max(0, summary["upto"] - offset)
+        if covered > len(history):
+            # Left over from a conversation that has since been reset
+            summary, covered = {"text": "", "upto": 0}, 0
+        budget = self.token_budget - reserved_tokens - estimate_tokens(summary["text"])
+
+        start = len(history)
+        while start > covered:
+            cost = estimate_tokens(history[start - 1]["content"])
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+
+        if start - covered >= self.summary_batch:
+            self._schedule_summary(user_id, summary, history[covered:start], offset + start)
+
+        window = history[start:]
+        if summary["text"]:
+            window = [{"role": "system", "content": f"Summary of the earlier conversation: {summary['text']}"}] + window
+        return window
+
+    def _schedule_summary(self, user_id, summary, messages, upto):
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._executor.submit(self._summarize, user_id, summary, messages, upto)
+
+    def _summarize(self, user_id, summary, messages, upto):
+        try:
+            transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+            prompt = (
+                f"Current summary: {summary['text'] or '(none)'}\n\n"
+                f"New conversation turns:\n{transcript}\n\n"
+                "Update the summary to include the new turns. Keep the customer's issue, "
+                "any details they gave and what was resolved. Reply with the summary only, in at most 5 sentences."
+            )
+            response = self.llm.invoke([
+                {"role": "system", "content": "You summarize customer service conversations."},
+                {"role": "user", "content": prompt}
+            ])
+            if isinstance(response, AIMessage):
+                response = response.content
+            text = self.clean(response)
+            applied = []
+
+            def store_summary(session):
+                current = session.get("summary") or {"text": "", "upto": 0}
+                # Discard the result if another update won or the conversation was reset
+                if current["upto"] == summary["upto"] and session.get("offset", 0) + len(session["history"]) >= upto:
+                    session["summary"] = {"text": text, "upto": upto}
+                    applied.append(True)
+
+            self.sessions.update(user_id, store_summary)
+            if applied:
+                logger.info(f"Updated history summary for {user_id} up to message {upto}")
+        except Exception as e:
+            logger.error(f"Error summarizing history for {user_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
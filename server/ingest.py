@@ -0,0 +1,266 @@
+"""Bulk, incremental knowledge-base ingestion.
+
+Chunks the documents under a source directory, embeds new or changed chunks
+with the serving model in large batches (optionally across processes) and
+upserts them into the Pinecone index, or into a local index directory for
+RETRIEVER_BACKEND=local. Chunk ids are derived from the source path and the
+chunk's content hash, and a manifest records what the index holds, so a
+refresh only embeds chunks whose text changed and deletes the ones that
+disappeared:
+
+    python ingest.py kb_docs/ --processes 4
+    python ingest.py kb_docs/ --target local --out kb_index
+"""
+import os
+import json
+import hashlib
+import logging
+import argparse
+import tempfile
+import numpy as np
+from retriever import LocalIndex
+
+logger = logging.getLogger(__name__)
+
+SOURCE_EXTENSIONS = (".txt", ".md", ".jsonl")
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+
+def iter_documents(root):
+    """Yield (source, text) for every supported file under ``root``, in a stable order.
+
+    A .jsonl file holds one document per line with a "text" field (and an
+    optional "id" used as its source name).
+    """
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if not name.endswith(SOURCE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            source = os.path.relpath(path, root).replace(os.sep, "/")
+            with open(path, encoding="utf-8") as f:
+                if name.endswith(".jsonl"):
+                    for number, line in enumerate(f):
+                        if line.strip():
+                            row = json.loads(line)
+                            yield row.get("id", f"{source}:{number}"), row["text"]
+                else:
+                    yield source, f.read()
+
+
+def chunk_text(text, max_words=200):
+    """Pack whole paragraphs into chunks of at most ``max_words`` words.
+
+    Splitting on paragraph boundaries keeps an edit from shifting every later
+    chunk, so unchanged paragraphs keep their content hash.
+    """
+    chunks, current, size = [], [], 0
+    for paragraph in (" ".join(block.split()) for block in text.split("\n\n")):
+        if not paragraph:
+            continue
+        words = paragraph.split(" ")
+        # Over-long paragraphs are cut into max_words pieces
+        pieces = [" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words)]
+        for piece in pieces:
+            piece_size = piece.count(" ") + 1
+            if current and size + piece_size > max_words:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += piece_size
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def iter_chunks(root, max_words=200):
+    """Yield (chunk_id, text, metadata) with content-addressed ids."""
+    for source, text in iter_documents(root):
+        for chunk in chunk_text(text, max_words):
+            digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+            yield f"{source}#{digest[:16]}", chunk, {"text": chunk, "source": source}
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return set(json.load(f)["ids"])
+    except FileNotFoundError:
+        return set()
+
+
+def save_manifest(path, ids):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"model": MODEL_NAME, "ids": sorted(ids)}, f)
+    os.replace(tmp_path, path)
+
+
+class Encoder:
+    """Batch encoder over the serving model, fanned out to a process pool if asked."""
+
+    def __init__(self, processes=1, batch_size=256):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(MODEL_NAME)
+        self.batch_size = batch_size
+        self.pool = self.model.start_multi_process_pool(["cpu"] * processes) if processes > 1 else None
+
+    def encode(self, texts):
+        if self.pool is not None:
+            return self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        return self.model.encode(texts, batch_size=self.batch_size)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+
+
+class PineconeSink:
+    writes_through = True
+
+    def __init__(self, index, upsert_batch=200):
+        self.index = index
+        self.upsert_batch = upsert_batch
+
+    def upsert(self, ids, embeddings, metadata):
+        vectors = [
+            {"id": vector_id, "values": embedding.tolist(), "metadata": meta}
+            for vector_id, embedding, meta in zip(ids, embeddings, metadata)
+        ]
+        for batch in batched(vectors, self.upsert_batch):
+            self.index.upsert(vectors=batch)
+
+    def delete(self, ids):
+        for batch in batched(sorted(ids), 1000):
+            self.index.delete(ids=batch)
+
+    def close(self):
+        pass
+
+
+class LocalIndexSink:
+    """Merges changes into a local index directory, rewritten once at the end."""
+
+    writes_through = False
+
+    def __init__(self, path, dim=EMBEDDING_DIM):
+        self.path = path
+        # Kept so that an index left with no vectors is still written with its width
+        self.dim = dim
+        self.vectors = {}
+        if os.path.exists(os.path.join(path, "metadata.jsonl")):
+            existing = LocalIndex.load(path, mmap=False)
+            self.dim = existing.embeddings.shape[1]
+            for row, vector_id in enumerate(existing.ids):
+                self.vectors[vector_id] = (existing.embeddings[row], existing.metadata[row])
+
+    def upsert(self, ids, embeddings, metadata):
+        for vector_id, embedding, meta in zip(ids, embeddings, metadata):
+            embedding = np.asarray(embedding, dtype=np.float32)
+            self.dim = embedding.shape[0]
+            self.vectors[vector_id] = (embedding, meta)
+
+    def delete(self, ids):
+        for vector_id in ids:
+            self.vectors.pop(vector_id, None)
+
+    def close(self):
+        ids = list(self.vectors)
+        embeddings = np.empty((len(ids), self.dim), dtype=np.float32)
+        for row, vector_id in enumerate(ids):
+            embeddings[row] = self.vectors[vector_id][0]
+        LocalIndex.save(self.path, ids, embeddings, [self.vectors[vector_id][1] for vector_id in ids])
+
+
+def ingest(root, sink, encoder, manifest_path, max_words=200, embed_batch=2048, delete_missing=True):
+    """Sync the index with the documents under ``root``; returns counts of what changed.
+
+    Chunks stream through in batches of ``embed_batch``. With a sink that writes
+    through (Pinecone) the manifest is saved after every batch, so an
+    interrupted run resumes where it stopped.
+    """
+    indexed = load_manifest(manifest_path)
+    seen = set()
+    counts = {"chunks": 0, "embedded": 0, "unchanged": 0, "deleted": 0}
+
+    def pending():
+        for chunk_id, text, meta in iter_chunks(root, max_words):
+            counts["chunks"] += 1
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            if chunk_id in indexed:
+                counts["unchanged"] += 1
+            else:
+                yield chunk_id, text, meta
+
+    for batch in batched(pending(), embed_batch):
+        ids, texts, metadata = zip(*batch)
+        embeddings = encoder.encode(list(texts))
+        sink.upsert(ids, embeddings, metadata)
+        indexed.update(ids)
+        counts["embedded"] += len(ids)
+        if sink.writes_through:
+            save_manifest(manifest_path, indexed)
+        logger.info(f"Embedded and upserted {counts['embedded']} chunks so far")
+
+    if delete_missing:
+        stale = indexed - seen
+        if stale:
+            sink.delete(stale)
+            indexed -= stale
+            counts["deleted"] = len(stale)
+    sink.close()
+    save_manifest(manifest_path, indexed)
+    return counts
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Chunk, embed and upsert knowledge-base documents incrementally.")
+    parser.add_argument("source", help="Directory of .txt, .md and .jsonl documents")
+    parser.add_argument("--target", choices=("pinecone", "local"), default=os.getenv("RETRIEVER_BACKEND", "pinecone"))
+    parser.add_argument("--index", default="test3", help="Pinecone index name")
+    parser.add_argument("--out", default=os.getenv("LOCAL_INDEX_DIR", "kb_index"), help="Local index directory")
+    parser.add_argument("--manifest", help="Manifest of indexed chunk ids (default: next to the index)")
+    parser.add_argument("--chunk-words", type=int, default=200)
+    parser.add_argument("--embed-batch", type=int, default=2048, help="Chunks embedded per round")
+    parser.add_argument("--encode-batch", type=int, default=256, help="Model batch size")
+    parser.add_argument("--upsert-batch", type=int, default=200, help="Vectors per Pinecone upsert")
+    parser.add_argument("--processes", type=int, default=1, help="Encoding processes")
+    parser.add_argument("--keep-missing", action="store_true", help="Do not delete chunks whose source is gone")
+    args = parser.parse_args()
+
+    if args.target == "local":
+        sink = LocalIndexSink(args.out)
+        manifest_path = args.manifest or os.path.join(args.out, "manifest.json")
+    else:
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        sink = PineconeSink(pc.Index(args.index), upsert_batch=args.upsert_batch)
+        manifest_path = args.manifest or f"{args.index}.manifest.json"
+    encoder = Encoder(processes=args.processes, batch_size=args.encode_batch)
+    try:
+        counts = ingest(args.source, sink, encoder, manifest_path, max_words=args.chunk_words,
+                        embed_batch=args.embed_batch, delete_missing=not args.keep_missing)
+    finally:
+        encoder.close()
+    logger.info(f"Ingestion finished: {counts}")
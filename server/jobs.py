@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file, drained by a pool of worker threads.
+
+    Jobs survive restarts and can be shared by every worker process on a node:
+    each job is claimed atomically with a lease, so a job whose worker died is
+    picked up again once the lease runs out. Failed jobs are retried with
+    jittered exponential backoff up to ``max_attempts``. Enqueueing is
+    idempotent on ``idempotency_key``.
+    """
+
+    def __init__(self, path="jobs.db", workers=2, max_attempts=5, base_delay=2.0, lease=300, poll_interval=0.5):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self.stats = {"enqueued": 0, "duplicates": 0, "succeeded": 0, "retried": 0, "failed": 0}
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "idempotency_key TEXT UNIQUE NOT NULL, status TEXT NOT NULL DEFAULT 'pending', "
+            "attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, locked_until REAL, "
+            "last_error TEXT, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, kind, handler):
+        """Route jobs of ``kind`` to ``handler(payload, last_attempt)``.
+
+        ``last_attempt`` is True when a failure would not be retried, so the
+        handler can settle for a degraded result instead of failing the job.
+        """
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, idempotency_key):
+        """Persist a job; returns False if one with the same key already exists."""
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO jobs (kind, payload, idempotency_key, run_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload), idempotency_key, now, now)
+        )
+        if cursor.rowcount == 0:
+            self.stats["duplicates"] += 1
+            return False
+        self.stats["enqueued"] += 1
+        self.start()
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        """Start the worker threads for this process (idempotent, fork-aware)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _claim(self):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE (status = 'pending' AND run_at <= ?) OR (status = 'running' AND locked_until < ?) "
+                "ORDER BY run_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                    (now + self.lease, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(*job)
+
+    def _execute(self, job_id, kind, payload, attempts):
+        conn = self._connect()
+        try:
+            self.handlers[kind](json.loads(payload), attempts + 1 >= self.max_attempts)
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self.stats["failed"] += 1
+                logger.error(f"Job {job_id} ({kind}) failed permanently after {attempts} attempts: {str(e)}")
+                conn.execute("UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ?", (str(e), job_id))
+            else:
+                self.stats["retried"] += 1
+                delay = self.base_delay * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+                logger.warning(f"Job {job_id} ({kind}) failed, retrying in {delay:.1f}s: {str(e)}")
+                conn.execute(
+                    "UPDATE jobs SET status = 'pending', run_at = ?, last_error = ? WHERE id = ?",
+                    (time.time() + delay, str(e), job_id)
+                )
+            return
+        self.stats["succeeded"] += 1
+        conn.execute("UPDATE jobs SET status = 'done', locked_until = NULL WHERE id = ?", (job_id,))
+
+    def purge(self, older_than=86400):
+        """Delete finished jobs older than ``older_than`` seconds."""
+        self._connect().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND created_at < ?", (time.time() - older_than,)
+        )
+
+    def depth(self):
+        """Number of jobs waiting or running."""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()[0]
@@ -0,0 +1,304 @@
+import math
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+RETRYABLE_ERRORS = ("APIConnectionError", "APITimeoutError")
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing a call when the gateway is saturated."""
+
+    def __init__(self, retry_after, reason="LLM capacity exhausted"):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Request-rate limiter: ``rate`` calls per second with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """Take a token; return how long to wait for it, or None if that exceeds ``max_wait``."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            delay = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if delay > max_wait:
+                return None
+            self.tokens -= 1
+            return delay
+
+
+def _retry_delay(error, attempt, base_delay, max_delay):
+    """Seconds to wait before retrying ``error``, or None if it is not retryable."""
+    status = getattr(error, "status_code", None)
+    if status not in RETRYABLE_STATUS and type(error).__name__ not in RETRYABLE_ERRORS:
+        return None
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+    return min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class LLMGateway:
+    """Front end for the chat model that keeps bursts from turning into 500s.
+
+    At most ``max_concurrency`` calls run at once, paced by an optional token
+    bucket of ``rate`` calls per second. Callers beyond that wait in a queue of
+    at most ``max_queue``; when it is full, or a caller would wait longer than
+    ``queue_timeout``, ``Overloaded`` is raised with a Retry-After estimate.
+    Identical prompts already in flight share one call. Rate-limit and
+    transient errors are retried with jittered exponential backoff, honouring
+    the upstream Retry-After. Sync callers (Flask threads) and async callers
+    (one ASGI event loop) are limited separately; a deployment uses one of them.
+    """
+
+    def __init__(self, llm, max_concurrency=8, max_queue=64, queue_timeout=30, rate=None, burst=None,
+                 max_retries=3, base_delay=0.5, max_delay=10):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphore = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._calls = 0
+        self._call_total = 0.0
+        self.counters = {"calls": 0, "coalesced": 0, "retries": 0, "shed": 0, "failed": 0}
+
+    def _retry_after(self):
+        average = self._call_total / self._calls if self._calls else 1.0
+        return max(1, math.ceil(average * (self._waiting + 1) / self.max_concurrency))
+
+    def _shed(self, retry_after=None):
+        with self._lock:
+            self.counters["shed"] += 1
+            retry_after = retry_after or self._retry_after()
+        raise Overloaded(math.ceil(retry_after))
+
+    def _enter_queue(self):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.counters["shed"] += 1
+                raise Overloaded(self._retry_after())
+            self._waiting += 1
+
+    def _leave_queue(self, waited, acquired):
+        with self._lock:
+            self._waiting -= 1
+            if acquired:
+                self._running += 1
+                self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+    def _release(self, elapsed):
+        with self._lock:
+            self._running -= 1
+            self._calls += 1
+            self._call_total += elapsed
+
+    def admit(self):
+        """Raise Overloaded now if a new call would be shed, for callers that cannot fail later."""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.counters["shed"] += 1
+                raise Overloaded(self._retry_after())
+
+    @contextmanager
+    def _slot(self):
+        self._enter_queue()
+        queued_at = time.perf_counter()
+        acquired = False
+        try:
+            acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+        finally:
+            self._leave_queue(time.perf_counter() - queued_at, acquired)
+        if not acquired:
+            self._shed()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def _async_slot(self):
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._enter_queue()
+        queued_at = time.perf_counter()
+        acquired = False
+        try:
+            await asyncio.wait_for(self._async_semaphore.acquire(), self.queue_timeout)
+            acquired = True
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._leave_queue(time.perf_counter() - queued_at, acquired)
+        if not acquired:
+            self._shed()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+            self._async_semaphore.release()
+
+    def _rate_delay(self):
+        if self.bucket is None:
+            return 0.0
+        delay = self.bucket.reserve(self.queue_timeout)
+        if delay is None:
+            self._shed(self.queue_timeout)
+        return delay
+
+    def _backoff(self, error, attempt):
+        delay = _retry_delay(error, attempt, self.base_delay, self.max_delay) if attempt < self.max_retries else None
+        if delay is None:
+            with self._lock:
+                self.counters["failed"] += 1
+            if getattr(error, "status_code", None) == 429:
+                # Still rate limited upstream: tell the client to back off instead of failing
+                self._shed()
+            raise error
+        with self._lock:
+            self.counters["retries"] += 1
+        logger.warning(f"LLM call failed ({str(error)}), retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    def _call(self, prompt):
+        with self._slot():
+            attempt = 0
+            while True:
+                time.sleep(self._rate_delay())
+                with self._lock:
+                    self.counters["calls"] += 1
+                try:
+                    return self.llm.invoke(prompt)
+                except Exception as e:
+                    time.sleep(self._backoff(e, attempt))
+                    attempt += 1
+
+    @staticmethod
+    def _key(prompt):
+        return hashlib.sha256(str(prompt).encode()).hexdigest()
+
+    def _join(self, key):
+        """Return (future, is_leader) for the in-flight call with this key."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def invoke(self, prompt):
+        key = self._key(prompt)
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = self._call(prompt)
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def ainvoke(self, prompt):
+        key = self._key(prompt)
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            async with self._async_slot():
+                attempt = 0
+                while True:
+                    await asyncio.sleep(self._rate_delay())
+                    with self._lock:
+                        self.counters["calls"] += 1
+                    try:
+                        result = await self.llm.ainvoke(prompt)
+                        break
+                    except Exception as e:
+                        await asyncio.sleep(self._backoff(e, attempt))
+                        attempt += 1
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def stream(self, prompt):
+        """Stream chunks, holding a slot until the stream ends; retried only before the first chunk."""
+        with self._slot():
+            attempt = 0
+            while True:
+                time.sleep(self._rate_delay())
+                with self._lock:
+                    self.counters["calls"] += 1
+                chunks = self.llm.stream(prompt)
+                try:
+                    first = next(chunks)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    time.sleep(self._backoff(e, attempt))
+                    attempt += 1
+                    continue
+                yield first
+                yield from chunks
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "queue_depth": self._waiting,
+                "in_flight": self._running,
+                "coalescing": len(self._inflight),
+                "avg_wait_ms": 1000 * self._wait_total / self._waits if self._waits else 0.0,
+                "max_wait_ms": 1000 * self._wait_max,
+                "avg_call_ms": 1000 * self._call_total / self._calls if self._calls else 0.0
+            }
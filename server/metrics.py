@@ -0,0 +1,183 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("vserve.trace")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = ContextVar("vserve_request_trace", default=None)
+
+
+def set_branch(branch):
+    """Tag the current request with the branch of the chat flow it took."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.branch = branch
+
+
+class RequestTrace:
+    """Stage timings collected for one request until it finishes."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.branch = "none"
+        self.started = time.perf_counter()
+        self.stages = []
+        self.finished = False
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """In-process counters and latency histograms rendered in Prometheus text format.
+
+    Requests are wrapped by ``begin_request()``/``finish()``; ``stage()`` blocks
+    inside a request are buffered and recorded with the branch the request ended
+    up taking, so every stage histogram can be split by ticket-flow branch.
+    Stages outside a request (background jobs) are tagged ``background``. With
+    ``trace_spans`` each finished request is also logged as one JSON span.
+    Values are per process.
+    """
+
+    def __init__(self, prefix="vserve", buckets=DEFAULT_BUCKETS, trace_spans=False):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.trace_spans = trace_spans
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of the hot path as stage ``name``."""
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            trace = _current_trace.get()
+            if trace is not None and not trace.finished:
+                trace.stages.append((name, elapsed, status))
+            else:
+                self.observe("stage_seconds", elapsed, stage=name, branch="background")
+                if status == "error":
+                    self.inc("stage_errors_total", stage=name, branch="background")
+
+    def begin_request(self, endpoint):
+        trace = RequestTrace(endpoint)
+        _current_trace.set(trace)
+        return trace
+
+    def finish(self, trace, status):
+        """Record a request's duration, outcome and buffered stage timings."""
+        if trace.finished:
+            return
+        trace.finished = True
+        elapsed = time.perf_counter() - trace.started
+        self.observe("request_seconds", elapsed, endpoint=trace.endpoint, branch=trace.branch)
+        self.inc("requests_total", endpoint=trace.endpoint, branch=trace.branch, status=str(status))
+        for name, seconds, stage_status in trace.stages:
+            self.observe("stage_seconds", seconds, stage=name, branch=trace.branch)
+            if stage_status == "error":
+                self.inc("stage_errors_total", stage=name, branch=trace.branch)
+        if self.trace_spans:
+            trace_logger.info(json.dumps({
+                "endpoint": trace.endpoint,
+                "branch": trace.branch,
+                "status": status,
+                "duration_ms": round(1000 * elapsed, 3),
+                "stages": [
+                    {"stage": name, "duration_ms": round(1000 * seconds, 3), "status": stage_status}
+                    for name, seconds, stage_status in trace.stages
+                ]
+            }))
+
+    def register_collector(self, name, collect):
+        """Export the numeric values of ``collect()`` (a possibly nested dict) as gauges."""
+        self._collectors[name] = collect
+
+    def _format_labels(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+    def _flatten(self, prefix, values):
+        for key, value in values.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, dict):
+                yield from self._flatten(name, value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield name, value
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{self._format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{self._format_labels(labels)} {count}")
+        for collector_name, collect in sorted(self._collectors.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                logger.error(f"Error collecting {collector_name} metrics: {str(e)}")
+                continue
+            for name, value in self._flatten(f"{self.prefix}_{collector_name}", values):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,48 @@
+from cache import TTLCache
+
+# chat_saves documents also hold the client's saved chats; only these are needed
+PROFILE_FIELDS = ("firstName", "lastName", "address", "contactNo", "role")
+
+
+def profile_from_snapshot(snapshot):
+    """Profile fields of a chat_saves snapshot; {} if the document does not exist."""
+    if not snapshot.exists:
+        return {}
+    data = snapshot.to_dict() or {}
+    return {field: data[field] for field in PROFILE_FIELDS if field in data}
+
+
+class ProfileCache:
+    """Per-user cache of chat_saves profile fields.
+
+    Entries expire after ``ttl`` seconds and can be dropped with
+    ``invalidate()`` by code that writes a profile. No Firestore listener is
+    used: the client rewrites chat_saves documents on every message, so a watch
+    would stream every chat archive and keep evicting unchanged profiles.
+    Missing profiles are cached as ``{}``.
+    """
+
+    def __init__(self, db, maxsize=10000, ttl=300):
+        self.db = db
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, user_id):
+        profile = self.cache.get(user_id)
+        if profile is None:
+            snapshot = self.db.collection("chat_saves").document(user_id).get(field_paths=PROFILE_FIELDS)
+            profile = profile_from_snapshot(snapshot)
+            self.cache.set(user_id, profile)
+        return profile
+
+    def lookup(self, user_id):
+        """Return the cached profile, or None if it has to be fetched."""
+        return self.cache.get(user_id)
+
+    def set(self, user_id, profile):
+        self.cache.set(user_id, profile)
+
+    def invalidate(self, user_id):
+        self.cache.pop(user_id)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+import argparse
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.jsonl"
+HNSW_FILE = "hnsw.bin"
+
+
+class LocalIndex:
+    """In-process vector index over a knowledge base that fits in RAM.
+
+    Exposes the same ``query()`` call and result shape as a Pinecone ``Index`` so
+    it can be swapped in for it. Exact search is a vectorized scan over the
+    embedding matrix; larger corpora can use an approximate HNSW index when
+    ``hnswlib`` is installed.
+
+    On disk an index is a directory holding ``embeddings.npy`` (float32, one row
+    per vector) and ``metadata.jsonl`` (one ``{"id": ..., "metadata": {...}}``
+    object per row, in the same order).
+    """
+
+    def __init__(self, ids, embeddings, metadata, metric="euclidean", approximate=False, hnsw_path=None):
+        if metric not in ("euclidean", "cosine"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.ids = ids
+        self.metadata = metadata
+        self.metric = metric
+        self.embeddings = embeddings
+        if metric == "cosine":
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            self.embeddings = embeddings / np.maximum(norms, 1e-12)
+        self._sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        self._hnsw = self._build_hnsw(hnsw_path) if approximate else None
+
+    @classmethod
+    def load(cls, path, metric="euclidean", mmap=True, approximate=False):
+        """Load an index directory written by ``save()``."""
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        ids, metadata = [], []
+        with open(os.path.join(path, METADATA_FILE), encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                ids.append(row["id"])
+                metadata.append(row.get("metadata", {}))
+        if len(ids) != embeddings.shape[0]:
+            raise ValueError(f"Index at {path} has {embeddings.shape[0]} vectors but {len(ids)} metadata rows")
+        logger.info(f"Loaded local index from {path} with {len(ids)} vectors")
+        return cls(ids, embeddings, metadata, metric=metric, approximate=approximate,
+                   hnsw_path=os.path.join(path, HNSW_FILE))
+
+    @staticmethod
+    def save(path, ids, embeddings, metadata):
+        """Write vectors and metadata in the on-disk layout read by ``load()``."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float32))
+        with open(os.path.join(path, METADATA_FILE), "w", encoding="utf-8") as f:
+            for vector_id, meta in zip(ids, metadata):
+                f.write(json.dumps({"id": vector_id, "metadata": meta}) + "\n")
+        # Any prebuilt approximate index is stale now
+        hnsw_path = os.path.join(path, HNSW_FILE)
+        if os.path.exists(hnsw_path):
+            os.remove(hnsw_path)
+
+    def _build_hnsw(self, hnsw_path):
+        if hnswlib is None:
+            raise ImportError("Approximate search requires hnswlib (pip install hnswlib)")
+        count, dim = self.embeddings.shape
+        hnsw = hnswlib.Index(space="l2" if self.metric == "euclidean" else "ip", dim=dim)
+        if hnsw_path and os.path.exists(hnsw_path):
+            hnsw.load_index(hnsw_path, max_elements=count)
+        else:
+            hnsw.init_index(max_elements=max(count, 1), ef_construction=200, M=16)
+            if count:
+                hnsw.add_items(np.asarray(self.embeddings), np.arange(count))
+            if hnsw_path:
+                hnsw.save_index(hnsw_path)
+        hnsw.set_ef(64)
+        return hnsw
+
+    def _search(self, vector, top_k):
+        """Return (row indices, scores) ordered best first."""
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(vector, k=top_k)
+            rows, distances = labels[0], distances[0]
+            # hnswlib's "ip" space returns 1 - dot product
+            return rows, distances if self.metric == "euclidean" else 1.0 - distances
+        if self.metric == "euclidean":
+            # Squared euclidean distance, like Pinecone: |x|^2 - 2x.q + |q|^2
+            scores = self._sq_norms - 2.0 * (self.embeddings @ vector) + vector @ vector
+            best = np.argpartition(scores, top_k - 1)[:top_k] if top_k < len(scores) else np.arange(len(scores))
+            rows = best[np.argsort(scores[best])]
+        else:
+            scores = self.embeddings @ vector
+            best = np.argpartition(-scores, top_k - 1)[:top_k] if top_k < len(scores) else np.arange(len(scores))
+            rows = best[np.argsort(-scores[best])]
+        return rows, scores[rows]
+
+    def query(self, vector, top_k=10, include_metadata=False, **kwargs):
+        """Return the top_k nearest vectors in Pinecone's ``{"matches": [...]}`` shape."""
+        top_k = min(top_k, len(self.ids))
+        if top_k <= 0:
+            return {"matches": []}
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.metric == "cosine":
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        rows, scores = self._search(vector, top_k)
+        matches = []
+        for row, score in zip(rows, scores):
+            match = {"id": self.ids[row], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    def describe_index_stats(self):
+        return {"dimension": self.embeddings.shape[1], "total_vector_count": len(self.ids)}
+
+
+def export_pinecone_index(index, path, batch_size=100):
+    """Copy every vector and its metadata from a Pinecone index into a local index directory."""
+    ids, embeddings, metadata = [], [], []
+    for id_batch in index.list():
+        for start in range(0, len(id_batch), batch_size):
+            fetched = index.fetch(ids=id_batch[start:start + batch_size])
+            for vector_id, vector in fetched.vectors.items():
+                ids.append(vector_id)
+                embeddings.append(vector.values)
+                metadata.append(vector.metadata or {})
+    LocalIndex.save(path, ids, embeddings, metadata)
+    logger.info(f"Exported {len(ids)} vectors to {path}")
+    return len(ids)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export a Pinecone index for the local retriever backend.")
+    parser.add_argument("--index", default="test3", help="Pinecone index name")
+    parser.add_argument("--out", default=os.getenv("LOCAL_INDEX_DIR", "kb_index"), help="Output directory")
+    args = parser.parse_args()
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    export_pinecone_index(pc.Index(args.index), args.out)
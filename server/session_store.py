@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def new_session():
+    return {"history": [], "ticket": None, "last_interaction": None}
+
+
+class SessionStore:
+    """Per-user chat session storage.
+
+    A session is a JSON-serializable dict holding the user's chat history, the
+    ticket flow state and the time of the last interaction. ``load()`` always
+    returns a private copy; changes are persisted by passing it to ``save()``,
+    or applied with ``update()``, which reads, modifies and writes the stored
+    session atomically. Sessions idle for longer than ``idle_ttl`` seconds are
+    evicted.
+    """
+
+    def __init__(self, idle_ttl=3600):
+        self.idle_ttl = idle_ttl
+        self._update_lock = threading.Lock()
+
+    def load(self, user_id):
+        data = self._get(user_id)
+        return json.loads(data) if data else new_session()
+
+    def save(self, user_id, session):
+        self._set(user_id, json.dumps(session))
+
+    def update(self, user_id, modify):
+        """Apply ``modify(session)`` to the stored session atomically and return the result."""
+        # Only atomic within this process; shared backends override it
+        with self._update_lock:
+            session = self.load(user_id)
+            modify(session)
+            self.save(user_id, session)
+            return session
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def _get(self, user_id):
+        raise NotImplementedError
+
+    def _set(self, user_id, data):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store bounded by idle TTL and a global memory cap.
+
+    Sessions are kept serialized, so ``max_bytes`` bounds the actual size of the
+    stored data. Least recently used sessions are evicted first.
+    """
+
+    def __init__(self, idle_ttl=3600, max_bytes=64 * 1024 * 1024):
+        super().__init__(idle_ttl)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._sessions = OrderedDict()  # user_id -> (data, last_access)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] + self.idle_ttl <= time.monotonic():
+                self._remove(user_id)
+                return None
+            self._sessions[user_id] = (entry[0], time.monotonic())
+            self._sessions.move_to_end(user_id)
+            return entry[0]
+
+    def _set(self, user_id, data):
+        with self._lock:
+            self._remove(user_id)
+            self._sessions[user_id] = (data, time.monotonic())
+            self._bytes += len(data)
+            self._evict()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id):
+        entry = self._sessions.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            user_id, (data, last_access) = next(iter(self._sessions.items()))
+            if last_access > cutoff and self._bytes <= self.max_bytes:
+                break
+            self._remove(user_id)
+            self.evictions += 1
+
+    def stats(self):
+        return {"sessions": len(self._sessions), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store shared by every worker process on a node through one SQLite file."""
+
+    def __init__(self, path="sessions.db", idle_ttl=3600, sweep_every=500):
+        super().__init__(idle_ttl)
+        self.path = path
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _get(self, user_id):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE user_id = ? AND updated_at > ?",
+            (user_id, time.time() - self.idle_ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, user_id, data):
+        conn = self._connect()
+        self._upsert(conn, user_id, data)
+        self._sweep(conn)
+
+    def _upsert(self, conn, user_id, data):
+        conn.execute(
+            "INSERT INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (user_id, data, time.time())
+        )
+
+    def _sweep(self, conn):
+        self._writes += 1
+        if self._writes % self.sweep_every == 0:
+            conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.idle_ttl,))
+
+    def update(self, user_id, modify):
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front, serializing updates across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            data = self._get(user_id)
+            session = json.loads(data) if data else new_session()
+            modify(session)
+            self._upsert(conn, user_id, json.dumps(session))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._sweep(conn)
+        return session
+
+    def delete(self, user_id):
+        self._connect().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def stats(self):
+        return {"sessions": self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]}
+
+
+class RedisSessionStore(SessionStore):
+    """Store shared across nodes; idle eviction is Redis key expiry."""
+
+    def __init__(self, url="redis://localhost:6379/0", idle_ttl=3600, prefix="vserve:session:"):
+        if redis is None:
+            raise ImportError("The redis session backend requires the redis package (pip install redis)")
+        super().__init__(idle_ttl)
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _get(self, user_id):
+        key = self.prefix + user_id
+        data = self._client.get(key)
+        if data is not None:
+            self._client.expire(key, self.idle_ttl)
+        return data
+
+    def _set(self, user_id, data):
+        self._client.set(self.prefix + user_id, data, ex=self.idle_ttl)
+
+    def update(self, user_id, modify):
+        key = self.prefix + user_id
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic transaction: retried if another writer changes the key first
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    session = json.loads(data) if data else new_session()
+                    modify(session)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(session), ex=self.idle_ttl)
+                    pipe.execute()
+                    return session
+                except redis.WatchError:
+                    continue
+
+    def delete(self, user_id):
+        self._client.delete(self.prefix + user_id)
+
+
+class SessionTurn:
+    """One request's view of a user's session: read once, written back once.
+
+    The messages appended, the ticket state set and any reset during the turn
+    are recorded, and ``commit()`` replays them onto the latest stored session
+    with a single ``update()``, so a concurrent turn of the same user in
+    another worker is not overwritten. ``trim(session)``, if given, bounds the
+    history after every change.
+    """
+
+    def __init__(self, store, user_id, trim=None):
+        self.store = store
+        self.user_id = user_id
+        self.trim = trim
+        self.session = store.load(user_id)
+        self._clear_changes()
+
+    def _clear_changes(self):
+        self._messages = []
+        self._ticket = None
+        self._ticket_changed = False
+        self._reset = False
+
+    @property
+    def history(self):
+        return self.session["history"]
+
+    @property
+    def ticket(self):
+        """The ticket flow state, or an empty dict outside a ticket flow."""
+        return self.session.get("ticket") or {}
+
+    def append(self, message):
+        self.session["history"].append(message)
+        self._messages.append(message)
+        if self.trim is not None:
+            self.trim(self.session)
+
+    def set_ticket(self, ticket):
+        self.session["ticket"] = ticket
+        self._ticket = ticket
+        self._ticket_changed = True
+
+    def touch(self, timestamp):
+        self.session["last_interaction"] = timestamp
+
+    def reset(self):
+        """Start the conversation over, dropping history, ticket state and summary."""
+        self.session = new_session()
+        self._clear_changes()
+        self._reset = True
+
+    def _apply(self, stored):
+        if self._reset:
+            stored.clear()
+            stored.update(new_session())
+        stored["history"].extend(self._messages)
+        if self._ticket_changed:
+            stored["ticket"] = self._ticket
+        stored["last_interaction"] = self.session.get("last_interaction")
+        if self.trim is not None:
+            self.trim(stored)
+
+    def commit(self):
+        """Write the turn's changes back; a turn without changes costs nothing."""
+        if self._messages or self._ticket_changed or self._reset:
+            self.session = self.store.update(self.user_id, self._apply)
+            self._clear_changes()
+
+
+def create_session_store():
+    """Build the session store selected by SESSION_BACKEND (memory, sqlite or redis)."""
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    idle_ttl = int(os.getenv("SESSION_IDLE_TTL", 3600))
+    if backend == "sqlite":
+        store = SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"), idle_ttl=idle_ttl)
+    elif backend == "redis":
+        store = RedisSessionStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"), idle_ttl=idle_ttl)
+    elif backend == "memory":
+        store = MemorySessionStore(idle_ttl=idle_ttl, max_bytes=int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024)))
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    logger.info(f"Using {backend} session store")
+    return store
@@ -0,0 +1,128 @@
+import json
+
+THINK_OPEN = "<think"
+THINK_CLOSE = "</think>"
+TICKET_TAGS = ("<needs_details_update>", "<needs_details>", "<needs_time>", "<needs_ticket>")
+
+
+def _partial_suffix(text, token):
+    """Length of the longest suffix of text that is a proper prefix of token."""
+    for size in range(min(len(text), len(token) - 1), 0, -1):
+        if token.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ThinkFilter:
+    """Incrementally drop <think>...</think> sections from a token stream.
+
+    Text that could still turn out to be the start of a tag is held back until
+    the next chunk resolves it, so tags split across chunks are handled too.
+    Content of an unterminated <think> block is never emitted.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_think = False
+        self._started = False
+
+    def feed(self, chunk):
+        """Consume a chunk and return the text that is safe to emit."""
+        self._buffer += chunk or ""
+        out = []
+        while self._buffer:
+            if self._in_think:
+                end = self._buffer.find(THINK_CLOSE)
+                if end == -1:
+                    keep = _partial_suffix(self._buffer, THINK_CLOSE)
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._buffer = self._buffer[end + len(THINK_CLOSE):]
+                self._in_think = False
+                continue
+
+            start = self._buffer.find(THINK_OPEN)
+            if start == -1:
+                keep = _partial_suffix(self._buffer, THINK_OPEN)
+                out.append(self._buffer[:len(self._buffer) - keep])
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+                break
+
+            rest = self._buffer[start + len(THINK_OPEN):]
+            if not rest:
+                # Cannot tell "<think>" from "<thinking" yet
+                out.append(self._buffer[:start])
+                self._buffer = self._buffer[start:]
+                break
+            if rest[0].isalnum() or rest[0] == "_":
+                # Not a think tag (e.g. "<thinking"), emit it as plain text
+                out.append(self._buffer[:start + len(THINK_OPEN)])
+                self._buffer = rest
+                continue
+            tag_end = rest.find(">")
+            if tag_end == -1:
+                out.append(self._buffer[:start])
+                self._buffer = self._buffer[start:]
+                break
+            out.append(self._buffer[:start])
+            self._buffer = rest[tag_end + 1:]
+            self._in_think = True
+        return self._emit("".join(out))
+
+    def flush(self):
+        """Return any held-back text once the stream has ended."""
+        remaining = "" if self._in_think else self._buffer
+        self._buffer = ""
+        return self._emit(remaining)
+
+    def _emit(self, text):
+        # Mirror the .strip() applied to complete responses for leading whitespace
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+class TagFilter:
+    """Remove ticket tags from a token stream while recording which were seen."""
+
+    def __init__(self, tags=TICKET_TAGS):
+        self.tags = tags
+        self.seen = set()
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """Consume a chunk and return it with complete tags removed."""
+        self._buffer += chunk or ""
+        out = []
+        while True:
+            start = self._buffer.find("<")
+            if start == -1:
+                out.append(self._buffer)
+                self._buffer = ""
+                break
+            out.append(self._buffer[:start])
+            self._buffer = self._buffer[start:]
+            tag = next((t for t in self.tags if self._buffer.startswith(t)), None)
+            if tag:
+                self.seen.add(tag)
+                self._buffer = self._buffer[len(tag):]
+            elif any(t.startswith(self._buffer) for t in self.tags):
+                # Possibly an incomplete tag, wait for more text
+                break
+            else:
+                out.append("<")
+                self._buffer = self._buffer[1:]
+        return "".join(out)
+
+    def flush(self):
+        """Return any held-back text once the stream has ended."""
+        remaining = self._buffer
+        self._buffer = ""
+        return remaining
+
+
+def sse_event(event, data, event_id=None):
+    """Format a Server-Sent Event with a JSON payload and an optional id."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
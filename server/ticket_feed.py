@@ -0,0 +1,206 @@
+import os
+import queue
+import asyncio
+import logging
+import secrets
+import threading
+from itertools import islice
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("created", "updated", "expired", "deleted")
+
+
+class TicketFilter:
+    """Per-subscriber event filter; an empty criterion matches everything."""
+
+    def __init__(self, user_id=None, statuses=None, types=None):
+        self.user_id = user_id
+        self.statuses = {status.lower() for status in statuses} if statuses else None
+        self.types = set(types) if types else None
+
+    @classmethod
+    def from_args(cls, args, user_id=None):
+        """Build a filter from ``types`` and ``status`` comma-separated query parameters."""
+        types = [t for t in args.get("types", "").split(",") if t]
+        unknown = set(types) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+        statuses = [s.strip() for s in args.get("status", "").split(",") if s.strip()]
+        return cls(user_id=user_id, statuses=statuses, types=types)
+
+    def matches(self, event):
+        if self.types is not None and event["type"] not in self.types:
+            return False
+        if self.user_id is not None and event.get("user_id") != self.user_id:
+            return False
+        if self.statuses is not None and (event.get("status") or "").lower() not in self.statuses:
+            return False
+        return True
+
+
+class Subscription:
+    """A subscriber's bounded event queue, read from a thread or an event loop.
+
+    A subscriber that falls ``maxsize`` events behind is marked ``lagged``; it
+    should tell its client to reload and disconnect rather than skip events.
+    """
+
+    def __init__(self, ticket_filter, maxsize, start_id, loop=None):
+        self.filter = ticket_filter
+        # Id of the last event published before this subscription, a resume point for its client
+        self.start_id = start_id
+        self.loop = loop
+        self.lagged = False
+        self.queue = asyncio.Queue(maxsize) if loop is not None else queue.Queue(maxsize)
+
+    def deliver(self, event):
+        if self.loop is None:
+            self._put(event)
+        else:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            self.lagged = True
+
+    def get(self, timeout):
+        """Next event, or None after ``timeout`` seconds without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TicketFeed:
+    """In-process fan-out of ticket create/update/expire events to SSE subscribers.
+
+    Events get increasing ids of the form ``<epoch>-<seq>``, where the epoch is
+    random per process, and the last ``history`` events are kept so a client
+    reconnecting with Last-Event-ID gets what it missed. If that is no longer
+    possible (another process or restart, or the events rolled out of the
+    buffer) ``subscribe`` returns None as the backlog and the client should
+    reload its ticket list.
+
+    By default the code that writes tickets publishes events, which only
+    reaches subscribers of the same process. With several workers, ``watch()``
+    instead derives events from one Firestore listener on the tickets
+    collection per process, and local ``publish`` calls are ignored.
+    """
+
+    def __init__(self, db, history=1000, subscriber_queue=256):
+        self.db = db
+        self.history = history
+        self.subscriber_queue = subscriber_queue
+        self.counters = {"published": 0, "delivered": 0, "lagged": 0, "resumed": 0, "resets": 0}
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Forked workers must not hand out the parent's ids for different events
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._watch = None
+        self.epoch = secrets.token_hex(4)
+        self._seq = 0
+        self._events = deque(maxlen=self.history)
+
+    @property
+    def local(self):
+        """Whether ticket writers should publish their own events."""
+        return self._watch is None
+
+    def publish(self, event_type, ticket_id, ticket=None):
+        if self.local:
+            self._publish(event_type, ticket_id, ticket)
+
+    def _publish(self, event_type, ticket_id, ticket=None):
+        ticket = ticket or {}
+        with self._lock:
+            self._seq += 1
+            event = {
+                "id": f"{self.epoch}-{self._seq}",
+                "type": event_type,
+                "ticket_id": ticket_id,
+                "user_id": ticket.get("user_id"),
+                "status": ticket.get("status"),
+                "ticket": {"id": ticket_id, **ticket},
+                "at": datetime.now().isoformat()
+            }
+            self._events.append(event)
+            self.counters["published"] += 1
+            for subscription in self._subscribers:
+                if subscription.filter.matches(event):
+                    subscription.deliver(event)
+                    self.counters["delivered"] += 1
+        return event
+
+    def _backlog(self, last_event_id, ticket_filter):
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        missed = self._seq - int(seq)
+        if missed < 0 or missed > len(self._events):
+            return None
+        return [event for event in islice(self._events, len(self._events) - missed, None)
+                if ticket_filter.matches(event)]
+
+    def subscribe(self, ticket_filter, last_event_id=None, loop=None):
+        """Register a subscriber; returns (subscription, missed events or None if unrecoverable)."""
+        with self._lock:
+            subscription = Subscription(ticket_filter, self.subscriber_queue, f"{self.epoch}-{self._seq}", loop)
+            backlog = self._backlog(last_event_id, ticket_filter) if last_event_id else []
+            if last_event_id:
+                self.counters["resumed" if backlog is not None else "resets"] += 1
+            self._subscribers.add(subscription)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if subscription.lagged:
+                self.counters["lagged"] += 1
+
+    def watch(self):
+        """Publish events from Firestore changes to the tickets collection (one listener per process)."""
+        if self._watch is not None:
+            return
+        primed = threading.Event()
+
+        def on_snapshot(snapshots, changes, read_time):
+            if not primed.is_set():
+                # The first snapshot lists every existing ticket, not changes
+                primed.set()
+                return
+            for change in changes:
+                ticket = change.document.to_dict() or {}
+                kind = change.type.name
+                if kind == "ADDED":
+                    self._publish("created", change.document.id, ticket)
+                elif kind == "MODIFIED":
+                    self._publish("updated", change.document.id, ticket)
+                else:
+                    expired = (ticket.get("deadline") or "") < datetime.now().isoformat()
+                    self._publish("expired" if expired else "deleted", change.document.id, ticket)
+
+        self._watch = self.db.collection("tickets").on_snapshot(on_snapshot)
+        logger.info("Watching tickets for the change feed")
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "subscribers": len(self._subscribers), "buffered": len(self._events)}
@@ -0,0 +1,176 @@
+import re
+import logging
+from langchain.schema import AIMessage
+from metrics import set_branch
+from intents import classify_issue, fill_placeholders
+
+logger = logging.getLogger(__name__)
+
+TIME_PROMPT = "Please provide your preferred time for the service (e.g., 2025-04-25 10:00 AM). <needs_time>"
+INVALID_TIME_PROMPT = "Please provide a valid time format (e.g., 2025-04-25 10:00 AM). <needs_time>"
+UPDATE_DETAILS_PROMPT = "Please provide the updated details: First Name: [Your First Name], Last Name: [Your Last Name], Address: [Your Address], Contact Number: [Your Contact Number] <needs_details_update>"
+
+TIME_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}\s*(?:AM|PM)', re.IGNORECASE)
+DETAIL_PATTERNS = {
+    "first_name": re.compile(r'First Name:\s*([^\,]+)', re.IGNORECASE),
+    "last_name": re.compile(r'Last Name:\s*([^\,]+)', re.IGNORECASE),
+    "address": re.compile(r'Address:\s*([^\,]+)', re.IGNORECASE),
+    "contact_no": re.compile(r'Contact Number:\s*([^\,]+)', re.IGNORECASE)
+}
+
+
+def is_confirmation(query):
+    """Whether the user accepted the details shown to them."""
+    user_response = query.lower()
+    return "no" in user_response or "correct" in user_response or "looks good" in user_response
+
+
+class TicketFlow:
+    """State machine that walks a user through ticket creation.
+
+    ``handle_turn()`` is consulted before retrieval and the LLM: confirming the
+    details, updating them and capturing the service time are answered from the
+    stored ticket state alone. ``handle_reply()`` post-processes an LLM reply,
+    starting the flow when the model flags an issue with ``<needs_details>``.
+    Both work on the request's ``SessionTurn``; the caller commits it.
+    """
+
+    def __init__(self, save_to_history, fetch_profile, llm, submit_ticket, classify=classify_issue):
+        self.save_to_history = save_to_history
+        self.fetch_profile = fetch_profile
+        self.llm = llm
+        self.submit_ticket = submit_ticket
+        self.classify = classify
+
+    def _save_turn(self, turn, query, response, **flags):
+        self.save_to_history(turn, {"role": "user", "content": query}, **flags)
+        self.save_to_history(turn, {"role": "assistant", "content": response}, **flags)
+
+    def handle_turn(self, turn, query):
+        """Answer a mid-flow turn without the LLM; returns None when the LLM is needed."""
+        ticket_state = turn.ticket
+        if ticket_state.get("needs_details_update", False):
+            set_branch("update_details")
+            return self._update_details(turn, query, ticket_state["ticket_info"])
+        if ticket_state.get("needs_details", False):
+            set_branch("confirm_details")
+            return self._confirm_details(turn, query, ticket_state["ticket_info"])
+        if ticket_state.get("needs_time", False):
+            set_branch("capture_time")
+            return self._capture_time(turn, query, ticket_state["ticket_info"])
+        return None
+
+    def handle_reply(self, turn, query, response, profile=None, query_embedding=None):
+        """Run the state machine on a think-free LLM reply and return the final response.
+
+        profile may carry the user's already fetched chat_saves profile fields;
+        query_embedding lets the issue classifier reuse the retrieval embedding.
+        """
+        if '<needs_details>' in response:
+            set_branch("present_details")
+            return self._present_details(turn, query, response, profile, query_embedding)
+        set_branch("llm")
+        self._save_turn(turn, query, response)
+        return response
+
+    def _present_details(self, turn, query, response, profile, query_embedding=None):
+        logger.debug(f"Entering needs_details block for user {turn.user_id}")
+        response = response.replace('<needs_details>', '').strip()
+        user_data = profile if profile is not None else self.fetch_profile(turn.user_id)
+        if not user_data:
+            logger.warning(f"No user data found for {turn.user_id}, using default values")
+        # Temporary description; generated by the LLM once the time is captured
+        ticket_info = {
+            "first_name": user_data.get("firstName", "Unknown First Name"),
+            "last_name": user_data.get("lastName", "Unknown Last Name"),
+            "address": user_data.get("address", "Unknown Address"),
+            "contact_no": user_data.get("contactNo", "Unknown Contact Number"),
+            "issue_title": self.classify(query, query_embedding),
+            "issue_description": "Temporary description"
+        }
+        if user_data:
+            # Captured now so ticket creation does not read the profile again
+            ticket_info["user_role"] = user_data.get("role")
+        # Replace placeholders in the response with actual user details
+        response = fill_placeholders(response, ticket_info)
+        self._save_turn(turn, query, response, needs_details=True, ticket_info=ticket_info)
+        return response
+
+    def _confirm_details(self, turn, query, ticket_info):
+        logger.debug(f"Processing needs_details confirmation for user {turn.user_id}")
+        if is_confirmation(query):
+            self._save_turn(turn, query, TIME_PROMPT, needs_time=True, ticket_info=ticket_info)
+            return TIME_PROMPT
+        self._save_turn(turn, query, UPDATE_DETAILS_PROMPT, needs_details=True, needs_details_update=True, ticket_info=ticket_info)
+        return UPDATE_DETAILS_PROMPT
+
+    def _update_details(self, turn, query, ticket_info):
+        logger.debug(f"Processing details update for user {turn.user_id}")
+        for field, pattern in DETAIL_PATTERNS.items():
+            match = pattern.search(query)
+            if match:
+                ticket_info[field] = match.group(1).strip()
+        self._save_turn(turn, query, TIME_PROMPT, needs_time=True, ticket_info=ticket_info)
+        return TIME_PROMPT
+
+    def _capture_time(self, turn, query, ticket_info):
+        logger.debug(f"Processing needs_time for user {turn.user_id}")
+        time_match = TIME_PATTERN.search(query)
+        if not time_match:
+            self._save_turn(turn, query, INVALID_TIME_PROMPT, needs_time=True, ticket_info=ticket_info)
+            return INVALID_TIME_PROMPT
+
+        scheduled_time = time_match.group(0).strip()
+        ticket_info["scheduled_time"] = scheduled_time
+        # The description is written and the ticket stored in the background
+        user_query_history = [msg["content"] for msg in turn.history if msg.get("role") == "user"]
+        ticket_id = self.submit_ticket(turn.user_id, ticket_info, user_query_history[-3:])
+        # The conversation starts over once the ticket is queued
+        turn.reset()
+        response = (
+            f"Thank you! A ticket is being created. "
+            f"TICKET_DETAILS: Ticket ID: {ticket_id}, "
+            f"First Name: {ticket_info['first_name']}, "
+            f"Last Name: {ticket_info['last_name']}, "
+            f"Address: {ticket_info['address']}, "
+            f"Contact Number: {ticket_info['contact_no']}, "
+            f"Issue Title: {ticket_info['issue_title']}, "
+            f"Scheduled Time: {scheduled_time} <needs_ticket>"
+        )
+        self._save_turn(turn, query, response, needs_ticket=True, ticket_info=ticket_info)
+        return response
+
+    def describe_issue(self, recent_queries, issue_title, fallback_on_error=True):
+        """Generate a short issue description from the user's recent messages.
+
+        LLM errors return a generic description, or are raised when
+        ``fallback_on_error`` is False so the caller can retry later.
+        """
+        fallback = "Customer reported an issue with " + issue_title.lower()
+        if not recent_queries:
+            return fallback
+        description_prompt = f"Based on these user messages: {', '.join(recent_queries)}, provide a 1-2 sentence description of their issue."
+        try:
+            description_response = self.llm.invoke(
+                [{"role": "system", "content": "You are a helpful assistant that writes concise issue descriptions."},
+                 {"role": "user", "content": description_prompt}]
+            )
+            if isinstance(description_response, AIMessage):
+                issue_description = description_response.content
+            else:
+                issue_description = description_response
+
+            # Clean up the description - remove any think tags, quotation marks, extra spaces
+            issue_description = re.sub(r'<think\b[^>]*>.*?</think>', '', issue_description, flags=re.DOTALL)
+            issue_description = issue_description.replace('"', '').strip()
+
+            # Limit description to 150 characters max
+            if len(issue_description) > 150:
+                issue_description = issue_description[:147] + "..."
+            logger.debug(f"Generated issue description: {issue_description}")
+            return issue_description
+        except Exception as e:
+            if not fallback_on_error:
+                raise
+            logger.error(f"Error generating issue description: {str(e)}")
+            return fallback
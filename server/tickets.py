@@ -0,0 +1,114 @@
+import json
+import base64
+from firebase_admin import firestore
+from cache import TTLCache
+
+MAX_PAGE_SIZE = 200
+# Fields a ticket document is written with; the only names accepted for projection
+TICKET_FIELDS = (
+    "user_id", "first_name", "last_name", "address", "contact_no", "issue_title",
+    "issue_description", "scheduled_time", "status", "created_at", "deadline", "last_updated"
+)
+
+
+def encode_cursor(ticket):
+    """Opaque cursor pointing just after ``ticket`` in created_at order."""
+    raw = json.dumps({"created_at": ticket.get("created_at"), "id": ticket["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(decoded, dict) or not isinstance(decoded.get("id"), str) or "created_at" not in decoded:
+        raise ValueError("Invalid cursor")
+    return decoded
+
+
+def parse_ticket_query(args, default_limit=50):
+    """Validate /get_tickets query parameters; raises ValueError on bad input."""
+    try:
+        limit = int(args.get("limit", default_limit))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    order = args.get("order", "desc").lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+    cursor = args.get("cursor")
+    fields = [field.strip() for field in args.get("fields", "").split(",") if field.strip()]
+    unknown = set(fields) - set(TICKET_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown ticket fields: {', '.join(sorted(unknown))}")
+    return {
+        "limit": limit,
+        "order": order,
+        "status": args.get("status") or None,
+        "cursor": decode_cursor(cursor) if cursor else None,
+        "fields": tuple(sorted(set(fields) | {"created_at"})) if fields else None
+    }
+
+
+def build_ticket_query(tickets_ref, user_id, params):
+    """Build the Firestore query for one page (plus one extra ticket to detect a next page).
+
+    Works with both the sync and async Firestore clients. Ordering by created_at
+    under an equality filter needs the composite indexes in firestore.indexes.json.
+    The document id breaks created_at ties, so a page boundary between tickets
+    created at the same instant neither skips nor repeats any of them.
+    """
+    direction = firestore.Query.DESCENDING if params["order"] == "desc" else firestore.Query.ASCENDING
+    query = tickets_ref.where("user_id", "==", user_id)
+    if params["status"]:
+        query = query.where("status", "==", params["status"])
+    query = query.order_by("created_at", direction=direction).order_by("__name__", direction=direction)
+    if params["fields"]:
+        query = query.select(params["fields"])
+    if params["cursor"]:
+        query = query.start_after({"created_at": params["cursor"]["created_at"], "__name__": params["cursor"]["id"]})
+    return query.limit(params["limit"] + 1)
+
+
+def build_page(snapshots, params):
+    """Turn the fetched snapshots into the /get_tickets response body."""
+    tickets = [{"id": ticket.id, **ticket.to_dict()} for ticket in snapshots]
+    has_more = len(tickets) > params["limit"]
+    tickets = tickets[:params["limit"]]
+    return {"tickets": tickets, "next_cursor": encode_cursor(tickets[-1]) if has_more else None}
+
+
+class TicketListCache:
+    """Short-lived cache of ticket pages, invalidated per user on writes."""
+
+    def __init__(self, maxsize=4096, ttl=30):
+        self.pages = TTLCache(maxsize=maxsize, ttl=ttl)
+        # ticket id -> owner, so a status update can find whose pages to drop
+        self.owners = TTLCache(maxsize=maxsize * 10, ttl=ttl)
+
+    @staticmethod
+    def _key(user_id, params):
+        return (user_id, params["limit"], params["order"], params["status"],
+                json.dumps(params["cursor"], sort_keys=True), params["fields"])
+
+    def get(self, user_id, params):
+        return self.pages.get(self._key(user_id, params))
+
+    def set(self, user_id, params, page):
+        self.pages.set(self._key(user_id, params), page)
+        for ticket in page["tickets"]:
+            self.owners.set(ticket["id"], user_id)
+
+    def invalidate_user(self, user_id):
+        self.pages.discard(lambda key: key[0] == user_id)
+
+    def invalidate_ticket(self, ticket_id):
+        owner = self.owners.pop(ticket_id)
+        if owner is None:
+            # The owner's pages may still be stale (e.g. a status-filtered page
+            # that did not contain this ticket), so drop everything
+            self.pages.clear()
+        else:
+            self.invalidate_user(owner)
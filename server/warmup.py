@@ -0,0 +1,123 @@
+import gc
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LazyResource:
+    """Proxy that builds an expensive object (model, index, client) on first use.
+
+    Attribute access is forwarded to the built object, so call sites use the
+    proxy as if it were the object itself. Concurrent first uses wait for a
+    single load; a failed load is retried by the next caller. ``per_process``
+    resources (network clients, which must not be shared across fork) are
+    rebuilt in each process; the others are built once and shared
+    copy-on-write by forked workers.
+    """
+
+    def __init__(self, name, factory, per_process=False):
+        self.name = name
+        self.factory = factory
+        self.per_process = per_process
+        self.load_seconds = None
+        self.error = None
+        self._value = _MISSING
+        self._pid = None
+        self._lock = threading.Lock()
+        # A lock held by a thread of the parent is never released in the child
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._value is not _MISSING and (not self.per_process or self._pid == os.getpid())
+
+    def get(self):
+        if self.loaded:
+            return self._value
+        with self._lock:
+            if not self.loaded:
+                started = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.error = str(e)
+                    logger.error(f"Error initializing {self.name}: {str(e)}")
+                    raise
+                self._pid = os.getpid()
+                self.error = None
+                self.load_seconds = time.perf_counter() - started
+                logger.info(f"Initialized {self.name} in {self.load_seconds:.2f}s")
+            return self._value
+
+    def __getattr__(self, attr):
+        # Only called for attributes the proxy itself does not have
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+
+class Warmup:
+    """Loads a set of LazyResources in parallel and reports readiness."""
+
+    def __init__(self, resources):
+        self.resources = {resource.name: resource for resource in resources}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Load every resource in background threads (idempotent, once per process)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for resource in self.resources.values():
+                if not resource.loaded:
+                    threading.Thread(target=self._load, args=(resource,), name=f"warmup-{resource.name}", daemon=True).start()
+
+    @staticmethod
+    def _load(resource):
+        try:
+            resource.get()
+        except Exception:
+            pass  # Logged by the resource; readiness keeps reporting the error
+
+    def preload(self):
+        """Load the fork-safe resources in this (pre-fork) process, synchronously.
+
+        Freezing the heap afterwards keeps the garbage collector from writing to
+        the shared pages, so forked workers really share them copy-on-write.
+        """
+        for resource in self.resources.values():
+            if not resource.per_process:
+                resource.get()
+        gc.collect()
+        gc.freeze()
+
+    def ready(self):
+        return all(resource.loaded for resource in self.resources.values())
+
+    def status(self):
+        return {
+            name: {
+                "ready": resource.loaded,
+                "load_ms": round(1000 * resource.load_seconds, 1) if resource.load_seconds is not None else None,
+                "error": resource.error
+            }
+            for name, resource in self.resources.items()
+        }
+
+    def stats(self):
+        return {
+            name: {"ready": int(resource.loaded), "load_ms": 1000 * (resource.load_seconds or 0.0)}
+            for name, resource in self.resources.items()
+        }